@@ -2,14 +2,20 @@ from telegram.ext import (
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    TypeHandler,
     filters,
 )
+from telegram import Update
+from claudebot.tools.auth import auth_gate
 from claudebot.tools.bot import app
 from claudebot.handlers.generic_handlers import (
     greet_user,
     pick_project,
     get_current_project,
     select_project,
+    picker_handler,
+    show_loop_stats,
+    show_memory_stats,
     error_handler,
 )
 from claudebot.handlers.git_handlers import (
@@ -22,6 +28,9 @@ from claudebot.handlers.git_handlers import (
     git_fetch,
     git_checkout,
     git_delete_branch,
+    git_rollback,
+    git_sparse,
+    rollback_handler,
 )
 from claudebot.handlers.claude_handlers import (
     check_login,
@@ -29,11 +38,21 @@ from claudebot.handlers.claude_handlers import (
     kill_claude,
     select_session_to_kill,
     get_active_claude_sessions,
+    peek_claude_session,
     transcription_to_claude_handler,
     voice_message_handler,
     clear_session,
+    show_resumable_sessions,
+    show_log_history,
+    log_history_handler,
+    search_log_history,
+    search_handler,
+    select_session_handler,
     schedule_message,
     schedule_continue_handler,
+    show_usage,
+    batch_prompt,
+    batch_file_handler,
     show_scheduled_jobs,
     delete_scheduled_job,
     delete_scheduled_job_handler,
@@ -41,12 +60,18 @@ from claudebot.handlers.claude_handlers import (
 
 app.add_error_handler(error_handler)
 
+app.add_handler(TypeHandler(Update, auth_gate), group=-1)
+
 app.add_handler(CommandHandler("start", greet_user))
 app.add_handler(CommandHandler("select", pick_project))
 app.add_handler(CommandHandler("current", get_current_project))
 app.add_handler(CommandHandler("sessions", get_active_claude_sessions))
 app.add_handler(CommandHandler("kill", kill_claude))
+app.add_handler(CommandHandler("peek", peek_claude_session))
 app.add_handler(CommandHandler("clear", clear_session))
+app.add_handler(CommandHandler("resume", show_resumable_sessions))
+app.add_handler(CommandHandler("history", show_log_history))
+app.add_handler(CommandHandler("search", search_log_history))
 app.add_handler(CommandHandler("gstat", git_status))
 app.add_handler(CommandHandler("gdiff", git_diff))
 app.add_handler(CommandHandler("greset", git_reset))
@@ -55,27 +80,39 @@ app.add_handler(CommandHandler("gpush", git_push))
 app.add_handler(CommandHandler("gfetch", git_fetch))
 app.add_handler(CommandHandler("gco", git_checkout))
 app.add_handler(CommandHandler("gdel", git_delete_branch))
+app.add_handler(CommandHandler("rollback", git_rollback))
+app.add_handler(CommandHandler("sparse", git_sparse))
 app.add_handler(CommandHandler("checklogin", check_login))
 app.add_handler(CommandHandler("schedule", schedule_message))
 app.add_handler(CommandHandler("showjobs", show_scheduled_jobs))
 app.add_handler(CommandHandler("deljob", delete_scheduled_job))
+app.add_handler(CommandHandler("usage", show_usage))
+app.add_handler(CommandHandler("loopstats", show_loop_stats))
+app.add_handler(CommandHandler("memstats", show_memory_stats))
+app.add_handler(CommandHandler("batch", batch_prompt))
 app.add_handler(CallbackQueryHandler(select_project, pattern="^selectproject_"))
+app.add_handler(CallbackQueryHandler(picker_handler, pattern="^picker_"))
 app.add_handler(
     CallbackQueryHandler(select_branch_for_checkout, pattern="^(gco_|gpush_|gdel_)")
 )
 app.add_handler(CallbackQueryHandler(select_session_to_kill, pattern="^kill_"))
+app.add_handler(CallbackQueryHandler(rollback_handler, pattern="^rollback_"))
+app.add_handler(CallbackQueryHandler(select_session_handler, pattern="^resume_"))
+app.add_handler(CallbackQueryHandler(log_history_handler, pattern="^loghist:"))
+app.add_handler(CallbackQueryHandler(schedule_continue_handler, pattern="^schedule_continue_"))
+app.add_handler(CallbackQueryHandler(search_handler, pattern="^search_"))
 app.add_handler(
     CallbackQueryHandler(
         transcription_to_claude_handler, pattern="^transcription_to_claude$"
     )
 )
+app.add_handler(CallbackQueryHandler(delete_scheduled_job_handler, pattern="^delete_schedule_"))
+app.add_handler(MessageHandler(filters.VOICE, voice_message_handler))
 app.add_handler(
-    CallbackQueryHandler(
-        schedule_continue_handler, pattern="^schedule_continue_"
+    MessageHandler(
+        filters.Document.ALL & filters.CaptionRegex(r"^/batch\b"), batch_file_handler
     )
 )
-app.add_handler(CallbackQueryHandler(delete_scheduled_job_handler, pattern="^delete_schedule_"))
-app.add_handler(MessageHandler(filters.VOICE, voice_message_handler))
 app.add_handler(MessageHandler(filters.TEXT, message_handler))
 
 
@@ -1,6 +1,6 @@
 import os
-import re
-import httpx
+import time
+from dataclasses import fields
 from datetime import datetime, timedelta
 from telegram import (
     Update,
@@ -10,71 +10,192 @@ from telegram import (
 from telegram.ext import (
     ContextTypes,
 )
-from apscheduler.triggers.date import DateTrigger
+from claudebot.tools.batch import Batch, BatchItem, match_projects, parse_batch_file
+from claudebot.tools.checkpoints import create_checkpoint
 from claudebot.tools.claude import Claude
-from claudebot.tools.logger import log_claude_response
-from claudebot.tools.shell import run_command
+from claudebot.tools.limits import DeferredPrompt, deferred_queue, parse_limit_reset
+from claudebot.tools.logger import (
+    HISTORY_KINDS,
+    HistoryCursor,
+    UsageTotals,
+    get_history,
+    get_tier_latency,
+    get_usage_totals,
+    log_claude_response,
+    log_claude_usage,
+    search_history,
+)
 from claudebot.settings import settings
 from claudebot.tools.auth import authenticated
-from claudebot.tools.bot import send_message
+from claudebot.tools.bot import MAX_DOWNLOAD_SIZE, MB, progress_editor, send_message
 from claudebot.tools.context import ctx
-from claudebot.tools.scheduler import scheduler
-from claudebot.tools.bot import send_direct_message
+from claudebot.tools.digest import repo_digest
+from claudebot.tools.inflight import inflight_runs
+from claudebot.tools.keyboards import (
+    EXPIRED_MENU_MESSAGE,
+    Picker,
+    apply_pending_filter,
+    callback_tokens,
+    send_picker,
+)
+from claudebot.tools.render import MAX_MESSAGE_LENGTH
+from claudebot.tools.procstats import ProcessUsage
+from claudebot.tools.routing import route_prompt, split_prefixes
+from claudebot.tools.git import git_status_cache
+from claudebot.tools.scheduler import get_scheduler
+from claudebot.tools.bot import schedule_resume, send_direct_message
+from claudebot.tools.sessions import session_registry
+from claudebot.tools.transcript import get_tailer
+from claudebot.tools.worktree import Worktree, base_project, worktree_pool
 
 
 
-async def process_claude_prompt(message: str, project: str):
+async def process_claude_prompt(
+    message: str, project: str, sessions: dict[str, Claude] | None = None
+) -> tuple[str, ProcessUsage | None]:
+    """Runs a prompt on a project; the session is registered in `sessions`, by default the
+    interactive ones that /kill, /peek and /sessions see."""
+    sessions = ctx.claude_sessions if sessions is None else sessions
     claude_session = Claude(os.path.join(settings.projects_dir, project))
-    ctx.claude_sessions[project] = claude_session
-    resume_session = not message.startswith("!")
+    sessions[project] = claude_session
+    prefixes, message = split_prefixes(message)
+    resume_session = "!" not in prefixes
     if not resume_session:
-        message = message[1:]
-    plan_mode = message.startswith("?")
-    if plan_mode:
-        message = message[1:]
-    ret, resp = await claude_session.send(
-        message, resume_session=resume_session, plan_mode=plan_mode
-    )
-    ctx.claude_sessions.pop(project, None)
+        ctx.selected_sessions.pop(project, None)
+    plan_mode = "?" in prefixes
+    route = route_prompt(claude_session.cwd, message, plan_mode, fast="~" in prefixes)
+    async with ctx.project_lock(project):
+        if settings.CHECKPOINTS:
+            try:
+                await create_checkpoint(claude_session.cwd, project, message)
+            except Exception as e:
+                print(f"Failed to create a checkpoint for {project}: {e}")
+        digest = None
+        if not resume_session and settings.REPO_DIGEST:
+            try:
+                digest = await repo_digest.get(claude_session.cwd)
+            except Exception as e:
+                print(f"Failed to build the repository digest for {project}: {e}")
+        started = time.monotonic()
+        ret, resp = await claude_session.send(
+            message,
+            resume_session=resume_session,
+            plan_mode=plan_mode,
+            session_id=ctx.selected_sessions.get(project),
+            append_system_prompt=digest,
+            model=route.model,
+            effort=route.effort,
+        )
+        latency_ms = int((time.monotonic() - started) * 1000)
+    if sessions.get(project) is claude_session:
+        sessions.pop(project)
+    git_status_cache.invalidate(claude_session.cwd)
     if ret != 0:
         print(f"Claude process exited with code {ret}")
-    return resp.strip()
+    result = claude_session.result
+    if result:
+        await log_claude_usage(project, result, route, latency_ms, claude_session.usage)
+        if project in ctx.selected_sessions and result.session_id:
+            ctx.selected_sessions[project] = result.session_id
+    return resp.strip(), claude_session.usage
 
-async def process_claude_prompt_and_answer(chat_id: int, message: str, project: str | None = None):
+async def process_claude_prompt_and_answer(
+    chat_id: int,
+    message: str,
+    project: str | None = None,
+    worktree: Worktree | None = None,
+    defer_on_limit: bool = True,
+):
     current_project = project or ctx.current_project
     if not current_project:
         raise ValueError("No project selected. Please select a project using /select.")
-    resp = await process_claude_prompt(message, current_project)
-    reply_markup = None
-    if "You've hit your limit" in resp:
-        ts_match = re.search(r"resets (\d+)(am|pm)", resp, re.IGNORECASE)
-        if ts_match:
-            hour = int(ts_match.group(1))
-            period = ts_match.group(2).lower()
-            
-            # 24-hour format
-            if period == "am":
-                if hour == 12:
-                    hour = 0
-            else:  # pm
-                if hour != 12:
-                    hour += 12
-            
-            time_str = f"{hour:02d}:00"
-            reply_markup = InlineKeyboardMarkup(
-                [[InlineKeyboardButton("Schedule continue", callback_data=f"schedule_continue_{time_str}")]]
-            )
-    await send_direct_message(
-        chat_id,
-        resp or "No response received from Claude.",
-        parse_mode="Markdown",
-        reply_markup=reply_markup
-    )
+    deferred_project = worktree.project if worktree else current_project
+    if defer_on_limit and deferred_queue.limited:
+        if worktree:
+            worktree_pool.release(worktree)
+        deferred_queue.defer(DeferredPrompt(chat_id, message, deferred_project))
+        await send_direct_message(
+            chat_id,
+            f"Claude usage limit reached. Your prompt for *{deferred_project}* is queued "
+            f"until {deferred_queue.limited_until:%H:%M}.",
+            parse_mode="Markdown",
+        )
+        return ""
+    run = inflight_runs.start(chat_id, current_project, message)
+    if inflight_runs.draining:
+        inflight_runs.finish(run)
+        if worktree:
+            worktree_pool.release(worktree)
+        await schedule_resume(run)
+        return ""
+    try:
+        resp, usage = await process_claude_prompt(message, current_project)
+    finally:
+        inflight_runs.finish(run)
+        if worktree:
+            worktree_pool.release(worktree)
+    if run.interrupted:
+        # The answer will come from the resumed run after the restart
+        return ""
+    answer = resp or "No response received from Claude."
+    reset_at = parse_limit_reset(resp)
+    if reset_at:
+        deferred_queue.schedule_drain(reset_at)
+        if defer_on_limit:
+            deferred_queue.defer(DeferredPrompt(chat_id, message, deferred_project))
+            answer += f"\n\nYour prompt is queued and will run at {reset_at:%H:%M}."
+    if worktree:
+        answer += (
+            f"\n\n**Worktree:** `{worktree.name}` on branch `{worktree.branch}`"
+            f"\nUse /select {worktree.name} and /gpush to push it."
+        )
+    if resp and usage and usage.peak_rss_kb:
+        answer += f"\n\n_{usage.summary()}_"
+    await send_direct_message(chat_id, answer, commonmark=True)
     await log_claude_response(current_project, resp)
 
     return resp
 
 
+async def run_deferred_prompt(prompt: DeferredPrompt) -> bool:
+    resp = await process_claude_prompt_and_answer(
+        prompt.chat_id, prompt.message, prompt.project, defer_on_limit=False
+    )
+    return parse_limit_reset(resp) is not None
+
+
+async def drain_deferred_prompts():
+    await deferred_queue.drain(run_deferred_prompt)
+
+
+@authenticated
+async def schedule_continue_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Answers the "Schedule continue" buttons left on older messages."""
+    if not update.callback_query:
+        return
+    await update.callback_query.answer(
+        "Prompts are now queued automatically until the usage limit resets."
+    )
+
+
+RESUME_PROMPT = (
+    "Your previous run was interrupted by a restart of the bot. "
+    "Continue where you left off and finish the task."
+)
+
+
+async def resume_interrupted_run(
+    chat_id: int, project: str, message: str, session_id: str | None = None
+):
+    """Resumes a run that was interrupted by a shutdown, in its session when it had one."""
+    if session_id:
+        ctx.selected_sessions[project] = session_id
+        prefixes, _ = split_prefixes(message)
+        message = prefixes.replace("!", "") + RESUME_PROMPT
+    await send_direct_message(chat_id, f"Resuming your interrupted prompt for {project}...")
+    await process_claude_prompt_and_answer(chat_id, message, project)
+
+
 @authenticated
 async def check_login(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     resp = await Claude.check_login()
@@ -90,6 +211,13 @@ async def check_login(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
 @authenticated
 async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if await apply_pending_filter(update, context):
+        return
+    if inflight_runs.draining and ctx.current_project and update.message and update.message.text:
+        await process_claude_prompt_and_answer(
+            update.message.chat_id, update.message.text, ctx.current_project
+        )
+        return
     if not ctx.current_project:
         await send_message(
             update,
@@ -97,20 +225,44 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             "No project selected. Please select a project using /select.",
         )
         return
-    claude_session = ctx.claude_sessions.get(ctx.current_project)
-    if claude_session:
+    if not update.message or not update.message.text:
+        await send_message(update, context, "No message found.")
+        return
+    project = ctx.current_project
+    message = update.message.text
+    worktree = None
+    claude_session = ctx.claude_sessions.get(project)
+    if claude_session and settings.WORKTREES:
+        try:
+            worktree = await worktree_pool.acquire(base_project(project))
+        except ValueError as e:
+            await send_message(update, context, f"Could not set up a worktree for this prompt: {e}")
+            return
+    if claude_session and not worktree:
         await send_message(
             update,
             context,
             "A Claude session is already processing a message. Please wait for it to finish before sending another message.",
         )
         return
-    if update.message and update.message.text:
-        await send_message(update, context, "Processing your message...")
-        await process_claude_prompt_and_answer(update.message.chat_id, update.message.text)
-
+    if worktree:
+        project = worktree.name
+        # A pooled worktree may hold the session of an unrelated task
+        if not message.startswith("!"):
+            message = "!" + message
+        await send_message(
+            update,
+            context,
+            f"Processing your message in worktree *{worktree.name}*...",
+            parse_mode="Markdown",
+        )
     else:
-        await send_message(update, context, "No message found.")
+        await send_message(update, context, "Processing your message...")
+    # Detached, so the chat's next updates (/kill, /peek...) are not queued behind the run
+    context.application.create_task(
+        process_claude_prompt_and_answer(update.message.chat_id, message, project, worktree),
+        update=update,
+    )
 
 
 @authenticated
@@ -166,6 +318,141 @@ async def get_active_claude_sessions(update: Update, context: ContextTypes.DEFAU
     else:
         await send_message(update, context, "No active Claude sessions found.")
 
+@authenticated
+async def peek_claude_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    project = context.args[0] if context.args else ctx.current_project
+    if not project:
+        await send_message(
+            update,
+            context,
+            "No project selected. Please select a project using /select.",
+        )
+        return
+    session_id = ctx.selected_sessions.get(project)
+    session = (
+        session_registry.get(project, session_id)
+        if session_id
+        else session_registry.latest(project)
+    )
+    if not session:
+        await send_message(update, context, f"No Claude session found for {project}.")
+        return
+    tailer = get_tailer(session.path)
+    tailer.read_new()
+    events = list(tailer.events)[-10:]
+    if not events:
+        await send_message(update, context, "No activity recorded in this session yet.")
+        return
+    lines = []
+    for event in events:
+        text = event.text if len(event.text) <= 300 else event.text[:300] + "..."
+        lines.append(f"🔧 {text}" if event.kind == "tool" else f"💬 {text}")
+    status = "running" if project in ctx.claude_sessions else "idle"
+    await send_message(
+        update, context, f"{project} ({status}):\n\n" + "\n\n".join(lines)
+    )
+
+BATCH_USAGE = (
+    "Usage: /batch <glob> <prompt>, or upload a file with the caption /batch "
+    "and one `project prompt` per line."
+)
+MAX_BATCH_FILE_SIZE = 1024 * 1024
+
+
+async def run_batch(update: Update, context: ContextTypes.DEFAULT_TYPE, items: list[BatchItem]):
+    missing = [
+        item.project
+        for item in items
+        if item.project.startswith(".")
+        or os.sep in item.project
+        or not os.path.isdir(os.path.join(settings.projects_dir, item.project))
+    ]
+    if missing:
+        await send_message(update, context, f"Projects not found: {', '.join(missing)}")
+        return
+    batch = Batch(items)
+    progress = await send_message(update, context, batch.progress())
+    # Kept apart from ctx.claude_sessions, so a timeout only ever kills the batch's own run
+    batch_sessions: dict[str, Claude] = {}
+    chat_id = update.effective_chat.id if update.effective_chat else settings.ALLOWED_USER_IDS[0]
+
+    async def run_item(item: BatchItem) -> str:
+        if deferred_queue.limited:
+            item.status = "skipped"
+            return f"Claude usage limit reached until {deferred_queue.limited_until:%H:%M}."
+        if item.project in ctx.claude_sessions or ctx.project_lock(item.project).locked():
+            item.status = "skipped"
+            return "The project is busy with another Claude run or git operation."
+        run = inflight_runs.start(chat_id, item.project, item.prompt, batch_sessions)
+        if inflight_runs.draining:
+            inflight_runs.finish(run)
+            await schedule_resume(run)
+            item.status = "skipped"
+            return "The bot is restarting, the prompt will run after the restart."
+        try:
+            resp, _ = await process_claude_prompt(item.prompt, item.project, batch_sessions)
+        finally:
+            inflight_runs.finish(run)
+        if run.interrupted:
+            item.status = "skipped"
+            return "Interrupted by a restart, the prompt resumes after the restart."
+        reset_at = parse_limit_reset(resp)
+        if reset_at:
+            deferred_queue.limited_until = reset_at
+            item.status = "failed"
+        await log_claude_response(item.project, resp)
+        return resp
+
+    async def kill_item(item: BatchItem):
+        claude_session = batch_sessions.pop(item.project, None)
+        if claude_session:
+            try:
+                await claude_session.kill()
+            except ProcessLookupError:
+                pass
+
+    await batch.run(run_item, kill_item, progress_editor(progress, "", limit=MAX_MESSAGE_LENGTH))
+    await send_message(update, context, batch.report())
+
+
+@authenticated
+async def batch_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not context.args or len(context.args) < 2:
+        await send_message(update, context, BATCH_USAGE)
+        return
+    projects = match_projects(context.args[0])
+    if not projects:
+        await send_message(update, context, f"No projects match {context.args[0]}.")
+        return
+    prompt = " ".join(context.args[1:])
+    context.application.create_task(
+        run_batch(update, context, [BatchItem(project, prompt) for project in projects]),
+        update=update,
+    )
+
+
+@authenticated
+async def batch_file_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not update.message or not update.message.document:
+        await send_message(update, context, "No document found.")
+        return
+    document = update.message.document
+    if document.file_size and document.file_size > MAX_BATCH_FILE_SIZE:
+        await send_message(update, context, "The batch file is too large.")
+        return
+    file = await document.get_file()
+    text = (await file.download_as_bytearray()).decode("utf-8", errors="replace")
+    try:
+        items = parse_batch_file(text)
+    except ValueError as e:
+        await send_message(update, context, f"{e}\n{BATCH_USAGE}")
+        return
+    if not items:
+        await send_message(update, context, BATCH_USAGE)
+        return
+    context.application.create_task(run_batch(update, context, items), update=update)
+
+
 @authenticated
 async def voice_message_handler(
     update: Update, context: ContextTypes.DEFAULT_TYPE
@@ -184,6 +471,14 @@ async def voice_message_handler(
         )
         return
 
+    if update.message.voice.file_size and update.message.voice.file_size > MAX_DOWNLOAD_SIZE:
+        await send_message(
+            update,
+            context,
+            f"The voice message is larger than {MAX_DOWNLOAD_SIZE // MB} MB, the download limit of the Bot API server.",
+        )
+        return
+
     file = await context.bot.get_file(update.message.voice.file_id)
     file_bytes = await file.download_as_bytearray()
     files = {
@@ -194,6 +489,8 @@ async def voice_message_handler(
         "language": settings.TRANSCRIPTION_LANGUAGE,
         "context_bias": "coding",
     }
+    import httpx
+
     async with httpx.AsyncClient() as client:
         response = await client.post(
             "https://api.mistral.ai/v1/audio/transcriptions",
@@ -250,7 +547,12 @@ async def transcription_to_claude_handler(
         await send_message(update, context, "No message found to reply to.")
         return
     await send_message(update, context, "Processing message with Claude...")
-    await process_claude_prompt_and_answer(update.callback_query.message.chat.id, transcription, ctx.current_project)
+    context.application.create_task(
+        process_claude_prompt_and_answer(
+            update.callback_query.message.chat.id, transcription, ctx.current_project
+        ),
+        update=update,
+    )
 
 
 @authenticated
@@ -262,10 +564,212 @@ async def clear_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             "No project selected. Please select a project using /select.",
         )
         return
-    cmd = 'ls -t ~/.claude/projects/$(echo $PWD | sed "s|/|-|g")/*.jsonl 2>/dev/null | head -1 | xargs rm -f'
-    await run_command(cmd, cwd=os.path.join(settings.projects_dir, ctx.current_project))
+    session_id = ctx.selected_sessions.pop(ctx.current_project, None)
+    session = (
+        session_registry.get(ctx.current_project, session_id)
+        if session_id
+        else session_registry.latest(ctx.current_project)
+    )
+    if not session:
+        await send_message(update, context, "No Claude session to clear.")
+        return
+    session_registry.delete(session)
     await send_message(update, context, "Claude session cleared successfully.")
 
+@authenticated
+async def show_resumable_sessions(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not ctx.current_project:
+        await send_message(
+            update,
+            context,
+            "No project selected. Please select a project using /select.",
+        )
+        return
+    sessions = session_registry.sessions(ctx.current_project)[:10]
+    if not sessions:
+        await send_message(update, context, "No Claude sessions found for this project.")
+        return
+    selected = ctx.selected_sessions.get(ctx.current_project)
+    keyboard = [[InlineKeyboardButton("Latest session", callback_data="resume_latest")]]
+    for session in sessions:
+        when = datetime.fromtimestamp(session.last_used).strftime("%d/%m %H:%M")
+        marker = "• " if session.session_id == selected else ""
+        label = f"{marker}{when} · {session.size // 1024} KB · {session.preview or session.session_id[:8]}"
+        keyboard.append(
+            [InlineKeyboardButton(label, callback_data=f"resume_{session.session_id}")]
+        )
+    await send_message(
+        update,
+        context,
+        "Select the Claude session to resume:",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+    )
+
+
+@authenticated
+async def select_session_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    if not query:
+        return
+    await query.answer()
+    if not ctx.current_project:
+        await query.edit_message_text(text="No project selected. Please select a project using /select.")
+        return
+    session_id = (query.data or "").split("resume_", 1)[-1]
+    if session_id == "latest":
+        ctx.selected_sessions.pop(ctx.current_project, None)
+        await query.edit_message_text(text="Resuming the latest Claude session.")
+        return
+    session = session_registry.get(ctx.current_project, session_id)
+    if not session:
+        await query.edit_message_text(text="Claude session not found.")
+        return
+    ctx.selected_sessions[ctx.current_project] = session_id
+    await query.edit_message_text(
+        text=f"Resuming Claude session {session_id}: {session.preview}"
+    )
+
+
+HISTORY_DEFAULT_ENTRIES = 10
+HISTORY_MAX_ENTRIES = 50
+
+
+async def send_log_history(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    project: str,
+    limit: int,
+    before: HistoryCursor | None = None,
+):
+    entries = await get_history(project, limit, before)
+    if not entries:
+        await send_message(update, context, f"No {'older ' if before else ''}history found for {project}.")
+        return
+    entry_length = max(200, (MAX_MESSAGE_LENGTH - 200) // len(entries) - 20)
+    lines = [f"History of {project}:"]
+    for entry in reversed(entries):
+        text = " ".join(entry.text.split())
+        if len(text) > entry_length:
+            text = text[:entry_length] + "..."
+        icon = "🧑" if entry.kind == "prompt" else "🤖"
+        lines.append(f"\n{icon} {entry.created_at:%d/%m %H:%M} {text}")
+    reply_markup = None
+    last = entries[-1]
+    cursor = (
+        f"loghist:{limit}:{round(last.created_at.timestamp() * 1_000_000)}:"
+        f"{last.kind[0]}{last.id}:{project}"
+    )
+    # Telegram rejects callback data longer than 64 bytes
+    if len(entries) == limit and len(cursor.encode()) <= 64:
+        reply_markup = InlineKeyboardMarkup(
+            [[InlineKeyboardButton("Older", callback_data=cursor)]]
+        )
+    await send_message(update, context, "\n".join(lines), reply_markup=reply_markup)
+
+
+@authenticated
+async def show_log_history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not settings.DATABASE_URL:
+        await send_message(update, context, "History needs a database. Please set DATABASE_URL.")
+        return
+    args = list(context.args or [])
+    limit = HISTORY_DEFAULT_ENTRIES
+    if args and args[-1].isdigit():
+        limit = min(max(1, int(args.pop())), HISTORY_MAX_ENTRIES)
+    project = args[0] if args else ctx.current_project
+    if not project:
+        await send_message(
+            update,
+            context,
+            "No project selected. Please select a project using /select or use /history <project> [n].",
+        )
+        return
+    await send_log_history(update, context, project, limit)
+
+
+@authenticated
+async def log_history_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    if not query:
+        return
+    await query.answer()
+    _, limit, before, last, project = (query.data or "").split(":", 4)
+    kind = next(kind for kind in HISTORY_KINDS if kind[0] == last[0])
+    cursor = HistoryCursor(
+        datetime.fromtimestamp(int(before) / 1_000_000).astimezone(), kind, int(last[1:])
+    )
+    await send_log_history(update, context, project, int(limit), cursor)
+
+
+SEARCH_PAGE_SIZE = 5
+
+
+async def send_search_results(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    query: str,
+    project: str | None,
+    page: int = 0,
+):
+    started = time.monotonic()
+    hits = await search_history(query, project, SEARCH_PAGE_SIZE + 1, page * SEARCH_PAGE_SIZE)
+    elapsed_ms = (time.monotonic() - started) * 1000
+    scope = f" in {project}" if project else ""
+    if not hits:
+        text = f"No {'more ' if page else ''}results for \"{query}\"{scope}."
+    else:
+        lines = [f"Results for \"{query}\"{scope}, page {page + 1} ({elapsed_ms:.0f} ms):"]
+        for hit in hits[:SEARCH_PAGE_SIZE]:
+            icon = "🧑" if hit.kind == "prompt" else "🤖"
+            lines.append(f"\n{icon} {hit.project or '-'} {hit.created_at:%d/%m/%y %H:%M}\n{hit.snippet}")
+        text = "\n".join(lines)
+    token = callback_tokens.put((query, project))
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("◀", callback_data=f"search_{token}_{page - 1}"))
+    if len(hits) > SEARCH_PAGE_SIZE:
+        navigation.append(InlineKeyboardButton("▶", callback_data=f"search_{token}_{page + 1}"))
+    reply_markup = InlineKeyboardMarkup([navigation]) if navigation else None
+    if update.callback_query:
+        await update.callback_query.edit_message_text(text=text, reply_markup=reply_markup)
+    else:
+        await send_message(update, context, text, reply_markup=reply_markup)
+
+
+@authenticated
+async def search_log_history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not settings.DATABASE_URL:
+        await send_message(update, context, "Search needs a database. Please set DATABASE_URL.")
+        return
+    from claudebot.tools.db import SEARCH_DIALECT
+
+    if not SEARCH_DIALECT:
+        await send_message(update, context, "Search needs a PostgreSQL or SQLite database.")
+        return
+    args = list(context.args or [])
+    project = None
+    if len(args) > 1 and os.path.isdir(os.path.join(settings.projects_dir, args[-1])):
+        project = args.pop()
+    if not args:
+        await send_message(update, context, "Usage: /search <query> [project]")
+        return
+    await send_search_results(update, context, " ".join(args), project)
+
+
+@authenticated
+async def search_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    if not query:
+        return
+    await query.answer()
+    token, _, page = (query.data or "").removeprefix("search_").partition("_")
+    search = callback_tokens.get(token)
+    if not search or not page.isdigit():
+        await send_message(update, context, EXPIRED_MENU_MESSAGE)
+        return
+    await send_search_results(update, context, *search, page=int(page))
+
+
 @authenticated
 async def schedule_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not ctx.current_project:
@@ -306,9 +810,10 @@ async def schedule_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if scheduled_time <= now:
         scheduled_time += timedelta(days=1)
     
-    scheduler.add_job(
+    get_scheduler().add_job(
         process_claude_prompt_and_answer,
-        trigger=DateTrigger(run_date=scheduled_time),
+        trigger="date",
+        run_date=scheduled_time,
         args=[update.message.chat_id, message_to_send, ctx.current_project],
         id=f"scheduled_message_{update.message.message_id}",
         replace_existing=True,
@@ -317,7 +822,7 @@ async def schedule_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 @authenticated
 async def show_scheduled_jobs(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    jobs = scheduler.get_jobs()
+    jobs = [job for job in get_scheduler().get_jobs() if job.id.startswith("scheduled_message_")]
     if not jobs:
         await send_message(update, context, "No messages currently scheduled.")
         return
@@ -339,45 +844,45 @@ async def show_scheduled_jobs(update: Update, context: ContextTypes.DEFAULT_TYPE
     await send_message(update, context, "\n".join(message_lines), parse_mode="Markdown")
 
 @authenticated
-async def schedule_continue_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not update.callback_query:
-        return
-    await update.callback_query.answer()
-    if not update.callback_query.message:
-        await send_message(update, context, "No message found to continue.")
-        return
-    data = update.callback_query.data or ""
-    time_str = data.split("schedule_continue_")[-1]
-    try:
-        scheduled_time = datetime.strptime(time_str, "%H:%M").replace(
-            year=datetime.now().year,
-            month=datetime.now().month,
-            day=datetime.now().day
-        )
-        if scheduled_time <= datetime.now():
-            scheduled_time += timedelta(days=1)
-    except ValueError:
-        await send_message(update, context, "Invalid time format in callback data.")
-        return
-    
-    scheduler.add_job(
-        process_claude_prompt_and_answer,
-        trigger=DateTrigger(run_date=scheduled_time),
-        args=[update.callback_query.message.chat.id, "continue", ctx.current_project],
-        id=f"scheduled_message_{update.callback_query.message.message_id}",
-        replace_existing=True,
+async def show_usage(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    totals = await get_usage_totals()
+    lines = ["*Claude usage*\n"]
+    total = UsageTotals()
+    for project, usage in sorted(totals.items()):
+        lines.append(f"• *{project}*: {format_usage(usage)}")
+        for field in fields(UsageTotals):
+            setattr(total, field.name, getattr(total, field.name) + getattr(usage, field.name))
+    lines.append(f"\n*Total*: {format_usage(total)}")
+    latencies = await get_tier_latency()
+    if latencies:
+        lines.append("\n*Latency by tier*")
+        for (tier, model), latency in sorted(latencies.items()):
+            lines.append(
+                f"• {tier} ({model}): {latency.runs} runs, avg {latency.average_ms / 1000:.0f}s, "
+                f"max {latency.max_latency_ms / 1000:.0f}s"
+            )
+    if deferred_queue.items:
+        when = f"{deferred_queue.limited_until:%H:%M}" if deferred_queue.limited_until else "N/A"
+        lines.append(f"\n*Deferred prompts:* {len(deferred_queue.items)}, running at {when}")
+    await send_message(update, context, "\n".join(lines), parse_mode="Markdown")
+
+
+def format_usage(usage: UsageTotals) -> str:
+    avg_duration = usage.duration_ms / usage.runs / 1000 if usage.runs else 0
+    return (
+        f"{usage.runs} runs, {usage.input_tokens} in / {usage.output_tokens} out tokens, "
+        f"${usage.cost_usd:.2f}, {usage.num_turns} turns, avg {avg_duration:.0f}s"
     )
-    await send_message(update, context, f"Message scheduled to be sent at {scheduled_time.strftime('%H:%M on %Y-%m-%d')}.")
+
 
 @authenticated
 async def delete_scheduled_job(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    jobs = scheduler.get_jobs()
+    jobs = [job for job in get_scheduler().get_jobs() if job.id.startswith("scheduled_message_")]
     if not jobs:
         await send_message(update, context, "No messages currently scheduled.")
         return
-    message_lines = ["*Delete schedule message*"]
-    
-    buttons = []
+    jobs.sort(key=lambda job: job.next_run_time.timestamp() if job.next_run_time else float("inf"))
+    items = []
     for job in jobs:
         run_time = job.next_run_time.strftime('%d/%m %H:%M') if job.next_run_time else "N/A"
         project_name = ""
@@ -385,10 +890,9 @@ async def delete_scheduled_job(update: Update, context: ContextTypes.DEFAULT_TYP
             project_name = job.args[2]
         
         button_label = f"{project_name} - {run_time}" if project_name else f"{run_time}"
-        buttons.append([InlineKeyboardButton(button_label, callback_data=f"delete_schedule_{job.id}")])
+        items.append((button_label, job.id))
     
-    reply_markup = InlineKeyboardMarkup(buttons)
-    await send_message(update, context, "\n".join(message_lines), parse_mode="Markdown", reply_markup=reply_markup)
+    await send_picker(update, context, Picker("delete_schedule", "Delete schedule message", items))
 
 @authenticated
 async def delete_scheduled_job_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -396,9 +900,12 @@ async def delete_scheduled_job_handler(update: Update, context: ContextTypes.DEF
         return
     await update.callback_query.answer()
     data = update.callback_query.data or ""
-    job_id = data.split("delete_schedule_")[-1]
+    job_id = callback_tokens.get(data.split("delete_schedule_")[-1])
+    if not job_id:
+        await send_message(update, context, EXPIRED_MENU_MESSAGE)
+        return
     try:
-        scheduler.remove_job(job_id)
+        get_scheduler().remove_job(job_id)
         await send_message(update, context, f"Scheduled job `{job_id}` deleted successfully.", parse_mode="Markdown")
     except Exception as e:
         await send_message(update, context, f"Error deleting scheduled job `{job_id}`: {e}", parse_mode="Markdown")
@@ -1,10 +1,8 @@
+import asyncio
 import os
+import time
 import traceback
-from telegram import (
-    Update,
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
-)
+from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.error import NetworkError, BadRequest, TimedOut
 from claudebot.tools.shell import run_command
@@ -12,6 +10,15 @@ from claudebot.settings import settings
 from claudebot.tools.auth import authenticated
 from claudebot.tools.bot import send_message
 from claudebot.tools.context import ctx
+from claudebot.tools.keyboards import (
+    EXPIRED_MENU_MESSAGE,
+    Picker,
+    callback_tokens,
+    request_filter,
+    send_picker,
+)
+from claudebot.tools.memstats import memory_profiler
+from claudebot.tools.watchdog import loop_watchdog
 
 
 @authenticated
@@ -23,6 +30,17 @@ async def greet_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     )
 
 
+def project_last_used(project: str) -> float:
+    """The git index changes on most git operations, so its mtime tells recently used projects."""
+    project_path = os.path.join(settings.projects_dir, project)
+    for path in (os.path.join(project_path, ".git", "index"), project_path):
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            continue
+    return 0
+
+
 @authenticated
 async def pick_project(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not context.args:
@@ -34,17 +52,11 @@ async def pick_project(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             and not d.startswith("_")
         ]
         if projects:
-            keyboard = [
-                [
-                    InlineKeyboardButton(
-                        project, callback_data=f"selectproject_{project}"
-                    )
-                ]
-                for project in projects
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await send_message(
-                update, context, "Pick a project:", reply_markup=reply_markup
+            projects.sort(key=project_last_used, reverse=True)
+            await send_picker(
+                update,
+                context,
+                Picker("selectproject", "Pick a project:", [(p, p) for p in projects]),
             )
         else:
             await send_message(
@@ -106,7 +118,10 @@ async def select_project(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await query.answer()
     option = query.data or "_"
     if option.startswith("selectproject_"):
-        project_name = option[len("selectproject_") :]
+        project_name = callback_tokens.get(option[len("selectproject_") :])
+        if not project_name:
+            await query.edit_message_text(text=EXPIRED_MENU_MESSAGE)
+            return
         context.args = [project_name]
         await query.edit_message_text(
             text=f"Starting Claude with project: {project_name}"
@@ -117,6 +132,86 @@ async def select_project(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 
 @authenticated
+async def picker_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    if not query:
+        return
+    await query.answer()
+    _, token, action, *args = (query.data or "").split("_")
+    picker = callback_tokens.get(token)
+    if not picker:
+        await query.edit_message_text(text=EXPIRED_MENU_MESSAGE)
+        return
+    if action == "filter":
+        request_filter(context, picker)
+        await send_message(update, context, "Send the text to filter the list by.")
+        return
+    if action == "page":
+        picker.page = int(args[0])
+    elif action == "clear":
+        picker.query = ""
+        picker.page = 0
+    else:
+        return
+    await query.edit_message_text(text=picker.text, reply_markup=picker.markup())
+
+
+@authenticated
+async def show_loop_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not loop_watchdog.started_at:
+        await send_message(update, context, "The event loop watchdog is not running.")
+        return
+    uptime = time.monotonic() - loop_watchdog.started_at
+    lines = [
+        f"Event loop lag over the last {len(loop_watchdog.lags)} ticks:",
+        f"p50 {loop_watchdog.percentile(50) * 1000:.1f} ms, "
+        f"p99 {loop_watchdog.percentile(99) * 1000:.1f} ms, "
+        f"max {loop_watchdog.max_lag * 1000:.0f} ms since start",
+        f"{loop_watchdog.stalls} stalls over {settings.LOOP_LAG_THRESHOLD_MS} ms in {uptime / 3600:.1f} h",
+    ]
+    blockers = loop_watchdog.worst_blockers()
+    if blockers:
+        lines.append("\nWorst blockers:")
+    for blocker in blockers:
+        lines.append(f"\n~{blocker.blocked * 1000:.0f} ms ({blocker.samples} samples) {blocker.location}")
+        lines.extend(f"  {frame}" for frame in blocker.stack)
+    await send_message(update, context, "\n".join(lines))
+
+
+def _allocation_site(stat) -> str:
+    frame = stat.traceback[0]
+    return f"{os.path.basename(frame.filename)}:{frame.lineno}"
+
+
+@authenticated
+async def show_memory_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    report = await asyncio.to_thread(memory_profiler.report)
+    lines = [f"RSS {report.rss_kb / 1024:.1f} MB"]
+    if not memory_profiler.enabled:
+        lines.append("Allocation tracing is off. Set MEMORY_PROFILING=true to enable it.")
+        await send_message(update, context, "\n".join(lines))
+        return
+    lines.append(
+        f"Traced {report.traced_kb / 1024:.1f} MB, peak {report.peak_traced_kb / 1024:.1f} MB"
+    )
+    lines.append("\nTop allocation sites:")
+    lines.extend(
+        f"{stat.size / 1024:8.0f} KB {stat.count:7} blocks  {_allocation_site(stat)}"
+        for stat in report.top
+    )
+    if report.previous_age is None:
+        lines.append("\nRun /memstats again to see the growth since this snapshot.")
+    elif report.growth:
+        lines.append(f"\nGrowth over the last {report.previous_age / 60:.0f} min:")
+        lines.extend(
+            f"{stat.size_diff / 1024:+8.0f} KB {stat.count_diff:+7} blocks  {_allocation_site(stat)}"
+            for stat in report.growth
+        )
+    else:
+        lines.append(f"\nNo growth over the last {report.previous_age / 60:.0f} min.")
+    await send_message(update, context, "\n".join(lines))
+
+
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     print(f"Exception while handling an update:\n{context.error}")
 
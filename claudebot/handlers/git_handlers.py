@@ -1,15 +1,45 @@
 import os
+from datetime import datetime
 from telegram import (
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
 )
 from telegram.ext import ContextTypes
-from claudebot.tools.shell import run_command
+from claudebot.tools.shell import run_command, stream_command
 from claudebot.settings import settings
 from claudebot.tools.auth import authenticated
-from claudebot.tools.bot import send_message
+from claudebot.tools.bot import progress_editor, send_message
+from claudebot.tools.checkpoints import (
+    checkpoint_prefix,
+    create_checkpoint,
+    list_checkpoints,
+    restore_checkpoint,
+)
 from claudebot.tools.context import ctx
+from claudebot.tools.keyboards import EXPIRED_MENU_MESSAGE, Picker, callback_tokens, send_picker
+from claudebot.tools.sparse import (
+    SPARSE_USAGE,
+    disable_sparse,
+    resolve_directories,
+    set_sparse,
+    sparse_directories,
+    sparse_profiles,
+)
+from claudebot.tools.git import (
+    MIRROR_PATH,
+    GitPipeline,
+    PipelineStep,
+    clone_command,
+    clone_directory,
+    format_status,
+    git_status_cache,
+    list_branches,
+    parse_clone_args,
+    update_mirror,
+)
+
+PROJECT_BUSY_MESSAGE = "Another git operation or Claude run is in progress on this project. Please try again when it is done."
 
 
 @authenticated
@@ -28,19 +58,16 @@ async def git_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         )
         return
 
-    ret_code, output = await run_command("git status", cwd=project_path)
-
-    if ret_code != 0:
-        await send_message(
-            update,
-            context,
-            f"Git status failed with code {ret_code}:\n```\n{output}\n```",
-            parse_mode="Markdown",
-        )
-    else:
-        await send_message(
-            update, context, f"```\n{output}\n```", parse_mode="Markdown"
-        )
+    try:
+        summary = await git_status_cache.get(project_path)
+    except ValueError as e:
+        await send_message(update, context, f"```\n{e}\n```", parse_mode="Markdown")
+        return
+    status = format_status(summary)
+    directories = await sparse_directories(project_path)
+    if directories is not None:
+        status += f"\nSparse checkout: {', '.join(directories) or 'root files only'}"
+    await send_message(update, context, f"```\n{status}\n```", parse_mode="Markdown")
 
 
 @authenticated
@@ -92,54 +119,136 @@ async def git_reset(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             update, context, f"Project directory not found: {ctx.current_project}"
         )
         return
+    lock = ctx.project_lock(ctx.current_project)
+    if lock.locked():
+        await send_message(update, context, PROJECT_BUSY_MESSAGE)
+        return
+
+    pipeline = GitPipeline(
+        "Git reset",
+        [
+            PipelineStep("reset", "git reset --hard"),
+            PipelineStep("clean", "git clean -fd", required=False),
+            PipelineStep("pull", "git pull --rebase"),
+        ],
+    )
+    async with lock:
+        await pipeline.run(project_path)
+    git_status_cache.invalidate(project_path)
+    await send_message(update, context, pipeline.report())
+
+
+@authenticated
+async def git_clone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        options = parse_clone_args(context.args or [])
+    except ValueError as e:
+        await send_message(update, context, str(e))
+        return
+
+    progress = await send_message(update, context, f"Cloning {options.url}...")
+    reference = None
+    if options.mirror:
+        ret_code, output = await update_mirror(
+            options.url, progress_editor(progress, "Updating mirror cache...")
+        )
+        if ret_code == 0:
+            reference = MIRROR_PATH
+        else:
+            await send_message(
+                update, context, f"Mirror update failed, cloning without it:\n{output[-800:]}"
+            )
 
-    ret_code, output = await run_command("git reset --hard", cwd=project_path)
+    ret_code, output = await stream_command(
+        clone_command(options, reference),
+        cwd=settings.projects_dir,
+        on_progress=progress_editor(progress, f"Cloning {options.url}..."),
+    )
 
     if ret_code != 0:
         await send_message(
-            update, context, f"Git reset failed with code {ret_code}:\n{output}"
+            update, context, f"Git clone failed with code {ret_code}:\n{output}"
         )
+        return
+    await send_message(update, context, f"Git clone successful:\n{output}")
+    if options.sparse:
+        project_path = os.path.join(settings.projects_dir, clone_directory(options.url))
+        await apply_sparse(update, context, project_path, options.sparse)
+
+
+async def apply_sparse(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    project_path: str,
+    entries: list[str],
+    add: bool = False,
+):
+    try:
+        directories = resolve_directories(project_path, entries)
+    except ValueError as e:
+        await send_message(update, context, str(e))
+        return
+    ret_code, output = await set_sparse(project_path, directories, add)
+    git_status_cache.invalidate(project_path)
+    if ret_code != 0:
+        await send_message(update, context, f"Sparse checkout failed with code {ret_code}:\n{output}")
+        return
+    await send_message(update, context, await describe_sparse(project_path))
+
+
+async def describe_sparse(project_path: str) -> str:
+    directories = await sparse_directories(project_path)
+    if directories is None:
+        text = "Every file is checked out."
     else:
-        _, output_clean = await run_command("git clean -fd", cwd=project_path)
-        output += "\n" + output_clean
-        ret_code_pull, output_pull = await run_command(
-            "git pull --rebase", cwd=project_path
+        text = "Sparse checkout of the root files and:\n" + (
+            "\n".join(f"• {directory}/" for directory in directories) or "no directory"
         )
-        output += "\n" + output_pull
-        if ret_code_pull != 0:
-            await send_message(
-                update,
-                context,
-                f"Git pull failed with code {ret_code_pull}:\n{output_pull}",
-            )
-        else:
-            await send_message(update, context, f"Git reset successful:\n{output}")
+    profiles = sparse_profiles(project_path)
+    if profiles:
+        text += "\n\nProfiles: " + ", ".join(profiles)
+    return text
 
 
 @authenticated
-async def git_clone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    repo_url = " ".join(context.args) if context.args else None
-    if not repo_url:
+async def git_sparse(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not ctx.current_project:
         await send_message(
             update,
             context,
-            "Please specify a repository URL. Usage: /gclone <repo_url>",
+            "No project selected. Please select a project using /select.",
         )
         return
-
-    if not repo_url.startswith("https://") and not repo_url.startswith("git@"):
-        repo_url = f"git@github.com:{repo_url}"
-
-    ret_code, output = await run_command(
-        f"git clone {repo_url}", cwd=settings.projects_dir
-    )
-
-    if ret_code != 0:
+    project_path = os.path.join(settings.projects_dir, ctx.current_project)
+    if not os.path.exists(project_path):
         await send_message(
-            update, context, f"Git clone failed with code {ret_code}:\n{output}"
+            update, context, f"Project directory not found: {ctx.current_project}"
         )
-    else:
-        await send_message(update, context, f"Git clone successful:\n{output}")
+        return
+    args = list(context.args or [])
+    if not args:
+        await send_message(update, context, f"{await describe_sparse(project_path)}\n\n{SPARSE_USAGE}")
+        return
+
+    lock = ctx.project_lock(ctx.current_project)
+    if lock.locked():
+        await send_message(update, context, PROJECT_BUSY_MESSAGE)
+        return
+    action = args.pop(0)
+    async with lock:
+        if action == "off" and not args:
+            ret_code, output = await disable_sparse(project_path)
+            git_status_cache.invalidate(project_path)
+            if ret_code != 0:
+                await send_message(update, context, f"Sparse checkout failed with code {ret_code}:\n{output}")
+            else:
+                await send_message(update, context, await describe_sparse(project_path))
+        elif action in ("set", "add") and args:
+            await apply_sparse(update, context, project_path, args, add=action == "add")
+        elif action == "profile" and len(args) == 1:
+            await apply_sparse(update, context, project_path, [f"@{args[0]}"])
+        else:
+            await send_message(update, context, SPARSE_USAGE)
 
 
 @authenticated
@@ -157,69 +266,49 @@ async def git_push(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             update, context, f"Project directory not found: {ctx.current_project}"
         )
         return
-
     branch = " ".join(context.args) if context.args else None
 
     if not branch:
-        ret_code, output = await run_command("git branch", cwd=project_path)
-
-        if ret_code != 0:
-            await send_message(update, context, f"Failed to get branches:\n{output}")
+        try:
+            branches = await list_branches(project_path)
+        except ValueError as e:
+            await send_message(update, context, f"Failed to get branches:\n{e}")
             return
-
-        branches = [
-            line.strip().lstrip("* ")
-            for line in output.strip().split("\n")
-            if line.strip()
+        items = [
+            (f"• {branch.name}" if branch.current else branch.name, branch.name)
+            for branch in branches
         ]
 
-        if not branches:
+        if not items:
             await send_message(update, context, "No branches found in the repository.")
             return
 
-        keyboard = [
-            [InlineKeyboardButton(branch, callback_data=f"gpush_{branch}")]
-            for branch in branches
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await send_message(
-            update, context, "Select branch to push:", reply_markup=reply_markup
-        )
+        await send_picker(update, context, Picker("gpush", "Select branch to push:", items))
         return
 
-    ret_code, output = await run_command("git branch --show-current", cwd=project_path)
-    if ret_code != 0:
-        await send_message(update, context, f"Failed to get current branch:\n{output}")
+    lock = ctx.project_lock(ctx.current_project)
+    if lock.locked():
+        await send_message(update, context, PROJECT_BUSY_MESSAGE)
         return
 
-    current_branch = output.strip()
-
-    if current_branch != branch:
-        ret_code, output = await run_command(
-            f"git checkout -b {branch}", cwd=project_path
-        )
+    async with lock:
+        ret_code, output = await run_command("git branch --show-current", cwd=project_path)
         if ret_code != 0:
-            await send_message(update, context, f"Failed to create branch:\n{output}")
+            await send_message(update, context, f"Failed to get current branch:\n{output}")
             return
 
-    ret_add, output_add = await run_command("git add .", cwd=project_path)
-    if ret_add != 0:
-        print(f"Git add failed with code {ret_add}:\n{output_add}")
-    ret_commit, output_commit = await run_command(
-        'git commit -m "Update from ClaudeBot"', cwd=project_path
-    )
-    if ret_commit != 0:
-        print(f"Git commit failed with code {ret_commit}:\n{output_commit}")
-    ret_code, output = await run_command(
-        f"git push -u origin {branch}", cwd=project_path
-    )
-
-    if ret_code != 0:
-        await send_message(
-            update, context, f"Git push failed with code {ret_code}:\n{output}"
-        )
-    else:
-        await send_message(update, context, f"Git push successful:\n{output}")
+        steps = []
+        if output.strip() != branch:
+            steps.append(PipelineStep("checkout", f"git checkout -b {branch}"))
+        steps += [
+            PipelineStep("add", "git add .", required=False),
+            PipelineStep("commit", 'git commit -m "Update from ClaudeBot"', required=False),
+            PipelineStep("push", f"git push -u origin {branch}"),
+        ]
+        pipeline = GitPipeline("Git push", steps)
+        await pipeline.run(project_path)
+    git_status_cache.invalidate(project_path)
+    await send_message(update, context, pipeline.report())
 
 
 @authenticated
@@ -237,8 +326,14 @@ async def git_fetch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             update, context, f"Project directory not found: {ctx.current_project}"
         )
         return
+    lock = ctx.project_lock(ctx.current_project)
+    if lock.locked():
+        await send_message(update, context, PROJECT_BUSY_MESSAGE)
+        return
 
-    ret_code, output = await run_command("git fetch", cwd=project_path)
+    async with lock:
+        ret_code, output = await run_command("git fetch", cwd=project_path)
+    git_status_cache.invalidate(project_path)
 
     if ret_code != 0:
         await send_message(
@@ -263,60 +358,47 @@ async def git_checkout(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             update, context, f"Project directory not found: {ctx.current_project}"
         )
         return
-
     branch = " ".join(context.args) if context.args else None
 
     if not branch:
-        ret_code, output = await run_command("git branch", cwd=project_path)
-
-        if ret_code != 0:
-            await send_message(update, context, f"Failed to get branches:\n{output}")
+        try:
+            branches = await list_branches(project_path)
+        except ValueError as e:
+            await send_message(update, context, f"Failed to get branches:\n{e}")
             return
-
-        branches = [
-            line.strip().lstrip("* ")
-            for line in output.strip().split("\n")
-            if line.strip()
+        items = [
+            (f"• {branch.name}" if branch.current else branch.name, branch.name)
+            for branch in branches
         ]
 
-        if not branches:
+        if not items:
             await send_message(update, context, "No branches found in the repository.")
             return
 
-        keyboard = [
-            [InlineKeyboardButton(branch, callback_data=f"gco_{branch}")]
-            for branch in branches
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await send_message(
-            update, context, "Select branch to checkout:", reply_markup=reply_markup
-        )
+        await send_picker(update, context, Picker("gco", "Select branch to checkout:", items))
         return
 
-    ret_code, output = await run_command(f"git checkout {branch}", cwd=project_path)
+    lock = ctx.project_lock(ctx.current_project)
+    if lock.locked():
+        await send_message(update, context, PROJECT_BUSY_MESSAGE)
+        return
 
-    if ret_code != 0:
-        ret_code, output = await run_command(
-            f"git checkout -b {branch}", cwd=project_path
+    async with lock:
+        pipeline = GitPipeline(
+            "Git checkout",
+            [
+                PipelineStep("checkout", f"git checkout {branch}"),
+                PipelineStep("pull", "git pull"),
+            ],
         )
-        if ret_code != 0:
-            await send_message(
-                update, context, f"Git checkout failed with code {ret_code}:\n{output}"
+        await pipeline.run(project_path)
+        if pipeline.steps[0].ret_code != 0:
+            pipeline = GitPipeline(
+                "New branch", [PipelineStep("checkout -b", f"git checkout -b {branch}")]
             )
-            return
-        else:
-            await send_message(update, context, f"New branch created:\n{output}")
-    else:
-        ret_code_pull, output_pull = await run_command("git pull", cwd=project_path)
-        output += "\n" + output_pull
-        if ret_code_pull != 0:
-            await send_message(
-                update,
-                context,
-                f"Git pull failed with code {ret_code_pull}:\n{output_pull}",
-            )
-        else:
-            await send_message(update, context, f"Git checkout successful:\n{output}")
+            await pipeline.run(project_path)
+    git_status_cache.invalidate(project_path)
+    await send_message(update, context, pipeline.report())
 
 
 @authenticated
@@ -338,33 +420,31 @@ async def git_delete_branch(update: Update, context: ContextTypes.DEFAULT_TYPE)
     branch = " ".join(context.args) if context.args else None
 
     if not branch:
-        ret_code, output = await run_command("git branch", cwd=project_path)
-
-        if ret_code != 0:
-            await send_message(update, context, f"Failed to get branches:\n{output}")
+        try:
+            branches = await list_branches(project_path)
+        except ValueError as e:
+            await send_message(update, context, f"Failed to get branches:\n{e}")
             return
-
-        branches = [
-            line.strip().lstrip("* ")
-            for line in output.strip().split("\n")
-            if line.strip() and not line.strip().startswith("*")
+        items = [
+            (f"• {branch.name}" if branch.current else branch.name, branch.name)
+            for branch in branches
+            if not branch.checked_out
         ]
 
-        if not branches:
+        if not items:
             await send_message(update, context, "No branches available for deletion.")
             return
 
-        keyboard = [
-            [InlineKeyboardButton(branch, callback_data=f"gdel_{branch}")]
-            for branch in branches
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await send_message(
-            update, context, "Select branch to delete:", reply_markup=reply_markup
-        )
+        await send_picker(update, context, Picker("gdel", "Select branch to delete:", items))
+        return
+
+    lock = ctx.project_lock(ctx.current_project)
+    if lock.locked():
+        await send_message(update, context, PROJECT_BUSY_MESSAGE)
         return
 
-    ret_code, output = await run_command(f"git branch -d {branch}", cwd=project_path)
+    async with lock:
+        ret_code, output = await run_command(f"git branch -d {branch}", cwd=project_path)
 
     if ret_code != 0:
         await send_message(
@@ -374,6 +454,74 @@ async def git_delete_branch(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await send_message(update, context, f"Branch *{branch}* deleted successfully.", parse_mode="Markdown")
 
 
+ROLLBACK_CHOICES = 8
+
+
+@authenticated
+async def git_rollback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not ctx.current_project:
+        await send_message(
+            update,
+            context,
+            "No project selected. Please select a project using /select.",
+        )
+        return
+    project_path = os.path.join(settings.projects_dir, ctx.current_project)
+    if not os.path.exists(project_path):
+        await send_message(
+            update, context, f"Project directory not found: {ctx.current_project}"
+        )
+        return
+    checkpoints = await list_checkpoints(project_path, ctx.current_project)
+    if not checkpoints:
+        await send_message(update, context, "No checkpoints found for this project.")
+        return
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                f"{datetime.fromtimestamp(checkpoint.created_at):%d/%m %H:%M} · {checkpoint.subject}",
+                callback_data=f"rollback_{checkpoint.ref.rsplit('/', 1)[-1]}",
+            )
+        ]
+        for checkpoint in checkpoints[:ROLLBACK_CHOICES]
+    ]
+    await send_message(
+        update,
+        context,
+        "Select the state to restore. Each checkpoint was taken before the Claude run it names:",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+    )
+
+
+@authenticated
+async def rollback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    if not query:
+        return
+    await query.answer()
+    if not ctx.current_project:
+        await query.edit_message_text(text="No project selected. Please select a project using /select.")
+        return
+    project_path = os.path.join(settings.projects_dir, ctx.current_project)
+    ref = checkpoint_prefix(ctx.current_project) + (query.data or "").split("rollback_", 1)[-1]
+    lock = ctx.project_lock(ctx.current_project)
+    if lock.locked():
+        await query.edit_message_text(text=PROJECT_BUSY_MESSAGE)
+        return
+    async with lock:
+        try:
+            # The current state gets a checkpoint too, so the rollback can be undone
+            await create_checkpoint(project_path, ctx.current_project, "before rollback")
+            await restore_checkpoint(project_path, ref)
+        except ValueError as e:
+            await query.edit_message_text(text=f"Rollback failed:\n{e}")
+            return
+        finally:
+            git_status_cache.invalidate(project_path)
+    summary = format_status(await git_status_cache.get(project_path))
+    await query.edit_message_text(text=f"Rollback successful:\n{summary}")
+
+
 @authenticated
 async def select_branch_for_checkout(
     update: Update, context: ContextTypes.DEFAULT_TYPE
@@ -384,7 +532,10 @@ async def select_branch_for_checkout(
     await query.answer()
     option = query.data or "_"
     if option.startswith("gpush_") or option.startswith("gco_") or option.startswith("gdel_"):
-        branch = option.split("_", 1)[1]
+        branch = callback_tokens.get(option.split("_", 1)[1])
+        if not branch:
+            await query.edit_message_text(text=EXPIRED_MENU_MESSAGE)
+            return
         context.args = [branch]
         if option.startswith("gco_"):
             await query.edit_message_text(text=f"Checking out branch: {branch}")
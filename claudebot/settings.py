@@ -10,8 +10,50 @@ class AppSettings(BaseSettings):
     DATABASE_URL: str | None = None
     MODEL: str = "opus"
     EFFORT: str = "high"
+    FAST_MODEL: str = "sonnet"
+    FAST_EFFORT: str = "low"
+    PLAN_TIER: str = "default"
+    SHORT_PROMPT_CHARS: int = 0
     MISTRAL_API_KEY: str = ""
     TRANSCRIPTION_LANGUAGE: str = "en"
+    WORKTREES: bool = False
+    WORKTREE_POOL_SIZE: int = 3
+    WORKTREE_TTL_HOURS: int = 24
+    SESSION_RETENTION_DAYS: int = 30
+    SESSION_MAX_PER_PROJECT: int = 50
+    DEFERRED_CONCURRENCY: int = 2
+    AUTH_ALERT_WINDOW: int = 600
+    AUTH_LOG_SAMPLE_RATE: int = 10
+    GIT_STATUS_CACHE_TTL: int = 10
+    GIT_FAST_STATUS_MIN_FILES: int = 20000
+    GIT_MIRROR_CACHE: bool = False
+    BATCH_CONCURRENCY: int = 3
+    BATCH_TIMEOUT: int = 1800
+    RESPONSE_RETENTION_DAYS: int = 0
+    LOG_RETENTION_DAYS: int = 0
+    LOG_PARTITIONING: bool = False
+    SEARCH_LANGUAGE: str = "english"
+    LOOP_LAG_THRESHOLD_MS: int = 250
+    MEMORY_PROFILING: bool = False
+    MEMORY_TRACEBACK_FRAMES: int = 10
+    MEMORY_SNAPSHOT_INTERVAL_MINUTES: int = 60
+    MEMORY_SNAPSHOT_DIR: str = "memstats"
+    MEMORY_SNAPSHOT_KEEP: int = 48
+    REPO_DIGEST: bool = True
+    REPO_DIGEST_MAX_CHARS: int = 12000
+    CHECKPOINTS: bool = True
+    CHECKPOINT_KEEP: int = 20
+    CHECKPOINT_MAX_AGE_DAYS: int = 7
+    SHUTDOWN_GRACE_SECONDS: int = 90
+    TELEGRAM_API_URL: str = ""
+    TELEGRAM_LOCAL_MODE: bool = False
+    TELEGRAM_HTTP_VERSION: str = "1.1"
+    TELEGRAM_POOL_SIZE: int = 256
+    TELEGRAM_CONNECT_TIMEOUT: float = 5.0
+    TELEGRAM_READ_TIMEOUT: float = 5.0
+    TELEGRAM_WRITE_TIMEOUT: float = 5.0
+    TELEGRAM_POOL_TIMEOUT: float = 1.0
+    TELEGRAM_MEDIA_WRITE_TIMEOUT: float = 20.0
 
     @property
     def projects_dir(self) -> str:
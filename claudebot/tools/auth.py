@@ -1,34 +1,83 @@
+import time
 from telegram import Update
-from telegram.ext import ContextTypes
+from telegram.ext import ApplicationHandlerStop, ContextTypes
 from claudebot.settings import settings
-from claudebot.tools.bot import send_message
+from claudebot.tools.keyboards import clear_pending_filter, has_pending_filter
 from claudebot.tools.logger import log
 
+ALLOWED_USER_IDS = frozenset(settings.ALLOWED_USER_IDS)
+MAX_TRACKED_USERS = 1000
 
-async def check_user(context: ContextTypes.DEFAULT_TYPE) -> bool:
-    allowed_user_ids = settings.ALLOWED_USER_IDS
-    if context._user_id not in allowed_user_ids:
+
+class UnauthorizedAlerts:
+    """Aggregates unauthorized attempts per user into one admin alert per time window."""
+
+    def __init__(self):
+        self.windows: dict[int | None, tuple[float, int]] = {}
+        self.attempts = 0
+
+    def register(self, user_id: int | None) -> int:
+        """Returns the number of attempts to report, or 0 while the alert is throttled."""
+        self.attempts += 1
+        now = time.monotonic()
+        window_start, suppressed = self.windows.get(user_id, (None, 0))
+        if window_start is not None and now - window_start < settings.AUTH_ALERT_WINDOW:
+            self.windows[user_id] = (window_start, suppressed + 1)
+            return 0
+        if len(self.windows) >= MAX_TRACKED_USERS:
+            self.windows = {
+                uid: window
+                for uid, window in self.windows.items()
+                if now - window[0] < settings.AUTH_ALERT_WINDOW
+            }
+        self.windows[user_id] = (now, 0)
+        return suppressed + 1
+
+
+unauthorized_alerts = UnauthorizedAlerts()
+
+
+def is_authorized(update: object) -> bool:
+    if not isinstance(update, Update) or not update.effective_user:
+        return False
+    return update.effective_user.id in ALLOWED_USER_IDS
+
+
+async def auth_gate(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if is_authorized(update):
+        return
+    if not isinstance(update, Update):
+        raise ApplicationHandlerStop
+    user_id = update.effective_user.id if update.effective_user else None
+    attempts = unauthorized_alerts.register(user_id)
+    sample_rate = max(1, settings.AUTH_LOG_SAMPLE_RATE)
+    if (unauthorized_alerts.attempts - 1) % sample_rate == 0:
+        await log(update, prompt=False)
+    if attempts:
         try:
             await context.bot.send_message(
-                chat_id=allowed_user_ids[0],
-                text=f"Unauthorized access attempt by user ID: {context._user_id}",
+                chat_id=settings.ALLOWED_USER_IDS[0],
+                text=f"Unauthorized access attempt by user ID: {user_id} ({attempts} attempts)",
             )
+            if update.effective_chat:
+                await context.bot.send_message(
+                    chat_id=update.effective_chat.id,
+                    text="Unauthorized access. This incident has been reported.",
+                )
         except Exception as e:
             print(f"Failed to send unauthorized access message: {e}")
-        return False
-    return True
+    raise ApplicationHandlerStop
 
 
 def authenticated(func):
     async def wrapper(
         update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs
     ):
-        await log(update)
-        if not await check_user(context):
-            await send_message(
-                update, context, "Unauthorized access. This incident has been reported."
-            )
+        if not is_authorized(update):
             return
+        # Before the handler runs, so the picker's own filter button can set a new request
+        clear_pending_filter(update, context)
+        await log(update, prompt=not has_pending_filter(context))
         return await func(update, context, *args, **kwargs)
 
     return wrapper
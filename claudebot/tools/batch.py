@@ -0,0 +1,139 @@
+import asyncio
+import fnmatch
+import os
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from claudebot.settings import settings
+from claudebot.tools.worktree import is_worktree
+
+BATCH_STATUS_ICONS = {
+    "queued": "⏳",
+    "running": "🔄",
+    "done": "✅",
+    "failed": "❌",
+    "timeout": "⌛",
+    "skipped": "⏭",
+}
+ANSWER_PREVIEW_LENGTH = 300
+PROGRESS_INTERVAL = 2.0
+
+
+@dataclass
+class BatchItem:
+    project: str
+    prompt: str
+    status: str = "queued"
+    answer: str = ""
+    duration: float = 0
+
+
+def match_projects(pattern: str) -> list[str]:
+    """Lists the projects whose directory name matches a shell glob, worktrees excluded."""
+    return sorted(
+        d
+        for d in os.listdir(settings.projects_dir)
+        if os.path.isdir(os.path.join(settings.projects_dir, d))
+        and not d.startswith((".", "_"))
+        and not is_worktree(d)
+        and fnmatch.fnmatch(d, pattern)
+    )
+
+
+def parse_batch_file(text: str) -> list[BatchItem]:
+    """Parses `project prompt` lines, skipping blank lines and # comments."""
+    items = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        project, _, prompt = line.partition(" ")
+        if not prompt.strip():
+            raise ValueError(f"Line {number} has no prompt: {line}")
+        items.append(BatchItem(project, prompt.strip()))
+    return items
+
+
+class Batch:
+    """Runs one prompt per project, at most `BATCH_CONCURRENCY` at once."""
+
+    def __init__(self, items: list[BatchItem]):
+        self.items = items
+        self.last_report = 0.0
+
+    @property
+    def finished(self) -> int:
+        return sum(1 for item in self.items if item.status not in ("queued", "running"))
+
+    def counts(self) -> dict[str, int]:
+        counts: dict[str, int] = {}
+        for item in self.items:
+            counts[item.status] = counts.get(item.status, 0) + 1
+        return counts
+
+    def progress(self) -> str:
+        counts = " ".join(
+            f"{BATCH_STATUS_ICONS[status]} {count}" for status, count in self.counts().items()
+        )
+        return f"Batch: {self.finished}/{len(self.items)} finished\n{counts}"
+
+    def report(self) -> str:
+        lines = [f"Batch finished: {len(self.items)} projects"]
+        for item in self.items:
+            lines.append("")
+            lines.append(
+                f"{BATCH_STATUS_ICONS[item.status]} {item.project} ({item.duration:.0f}s)"
+            )
+            answer = " ".join(item.answer.split())
+            if len(answer) > ANSWER_PREVIEW_LENGTH:
+                answer = answer[:ANSWER_PREVIEW_LENGTH] + "..."
+            if answer:
+                lines.append(answer)
+        return "\n".join(lines)
+
+    async def run(
+        self,
+        run_item: Callable[[BatchItem], Awaitable[str]],
+        on_timeout: Callable[[BatchItem], Awaitable] | None = None,
+        on_progress: Callable[[str], Awaitable] | None = None,
+    ):
+        """Runs every item through `run_item`, reporting progress after each state change.
+
+        `run_item` returns the answer, or raises to fail the item; it may also
+        mark the item skipped. Items that exceed `BATCH_TIMEOUT` seconds are
+        cancelled and passed to `on_timeout`. Progress is throttled to one
+        report every `PROGRESS_INTERVAL` seconds, plus the final one.
+        """
+        semaphore = asyncio.Semaphore(max(1, settings.BATCH_CONCURRENCY))
+
+        async def report():
+            now = time.monotonic()
+            done = self.finished == len(self.items)
+            if on_progress and (done or now - self.last_report >= PROGRESS_INTERVAL):
+                self.last_report = now
+                await on_progress(self.progress())
+
+        async def run_one(item: BatchItem):
+            async with semaphore:
+                item.status = "running"
+                await report()
+                start = time.monotonic()
+                try:
+                    item.answer = await asyncio.wait_for(
+                        run_item(item), timeout=settings.BATCH_TIMEOUT or None
+                    )
+                    if item.status == "running":
+                        item.status = "done"
+                except asyncio.TimeoutError:
+                    item.status = "timeout"
+                    item.answer = f"Timed out after {settings.BATCH_TIMEOUT}s"
+                    if on_timeout:
+                        await on_timeout(item)
+                except Exception as e:
+                    item.status = "failed"
+                    item.answer = str(e)
+                item.duration = time.monotonic() - start
+                await report()
+
+        await asyncio.gather(*(run_one(item) for item in self.items))
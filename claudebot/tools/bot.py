@@ -1,8 +1,112 @@
+import asyncio
+import importlib.util
+import signal
+import uuid
+from datetime import datetime
+
 from telegram import BotCommand, Update
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, TelegramError
 from telegram.ext import ApplicationBuilder, ContextTypes
 
 from claudebot.settings import settings
-from claudebot.tools.scheduler import scheduler
+from claudebot.tools import profiling
+from claudebot.tools.context import ctx
+from claudebot.tools.inflight import InFlightRun, inflight_runs
+from claudebot.tools.limits import deferred_queue
+from claudebot.tools.render import MAX_MESSAGE_LENGTH, render_markdown, to_plain_text
+from claudebot.tools.logger import index_search_backlog, prune_logs
+from claudebot.tools.memstats import memory_profiler
+from claudebot.tools.scheduler import get_scheduler
+from claudebot.tools.sessions import prune_sessions, session_registry
+from claudebot.tools.updates import PerChatUpdateProcessor
+from claudebot.tools.watchdog import loop_watchdog
+
+background_tasks: set[asyncio.Task] = set()
+
+# Referenced by name: the job runs in the next process and handlers import this module
+RESUME_JOB = "claudebot.handlers.claude_handlers:resume_interrupted_run"
+
+
+def run_in_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+async def post_init(application):
+    """Start the bot services in the background so polling starts right away"""
+    run_in_background(start_scheduler())
+    run_in_background(setup_commands(application))
+    run_in_background(loop_watchdog.run())
+    run_in_background(memory_profiler.run())
+    if profiling.profiler:
+        run_in_background(profiling.profiler.report_first_poll(application))
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            # Replaces the handler run_polling installed, which stops without waiting for Claude
+            loop.add_signal_handler(sig, lambda: run_in_background(drain_and_stop(application)))
+        except (NotImplementedError, RuntimeError):
+            pass
+
+
+async def drain_and_stop(application):
+    """Stops taking prompts, waits for the running ones, then hands the rest to the next process."""
+    if inflight_runs.draining:
+        # A second signal stops right away
+        inflight_runs.deadline = 0
+        return
+    inflight_runs.draining = True
+    print(
+        f"Shutting down: waiting up to {settings.SHUTDOWN_GRACE_SECONDS}s "
+        f"for {len(inflight_runs.runs)} Claude runs"
+    )
+    if not await inflight_runs.wait(settings.SHUTDOWN_GRACE_SECONDS):
+        runs = inflight_runs.interrupt()
+        for run in runs:
+            sessions = ctx.claude_sessions if run.sessions is None else run.sessions
+            claude_session = sessions.get(run.project)
+            if claude_session:
+                try:
+                    await claude_session.kill()
+                except ProcessLookupError:
+                    pass
+            await schedule_resume(run)
+    application.stop_running()
+
+
+async def schedule_resume(run: InFlightRun):
+    """Persists a run in the job store, to be resumed as soon as the next process starts."""
+    session = next(
+        (s for s in session_registry.sessions(run.project) if s.last_used >= run.started_at),
+        None,
+    )
+    scheduler = await asyncio.to_thread(get_scheduler)
+    if not scheduler.running:
+        scheduler.start(paused=True)
+    else:
+        scheduler.pause()
+    scheduler.add_job(
+        RESUME_JOB,
+        trigger="date",
+        run_date=datetime.now(),
+        args=[run.chat_id, run.project, run.message, session.session_id if session else None],
+        id=f"resume_run_{uuid.uuid4().hex}",
+        misfire_grace_time=None,
+    )
+    try:
+        await send_direct_message(
+            run.chat_id,
+            f"The bot is restarting. Your prompt for {run.project} will resume after the restart.",
+        )
+    except TelegramError as e:
+        print(f"Failed to notify chat {run.chat_id} about the restart: {e}")
+
+
+SET_COMMANDS_ATTEMPTS = 5
+
 
 async def setup_commands(application):
     """Set up bot commands for autocomplete"""
@@ -21,37 +125,163 @@ async def setup_commands(application):
             "gfetch", "Fetch updates from the git repository of the current project"
         ),
         BotCommand("gdel", "Delete a git branch"),
+        BotCommand("sparse", "Show or change the sparse checkout of the current project"),
+        BotCommand("rollback", "Restore the project as it was before a Claude run"),
         BotCommand("schedule", "Schedule a message to be sent to Claude"),
         BotCommand("showjobs", "Show scheduled messages"),
         BotCommand("deljob", "Delete a scheduled message"),
+        BotCommand("batch", "Send a prompt to every project matching a glob"),
+        BotCommand("usage", "Show Claude usage and deferred prompts"),
         BotCommand("sessions", "List active Claude sessions"),
         BotCommand("kill", "Kill an active Claude session"),
+        BotCommand("peek", "Show the latest activity of a Claude session"),
         BotCommand("clear", "Clear the current Claude session"),
+        BotCommand("resume", "Switch between past Claude sessions"),
+        BotCommand("history", "Show the latest prompts and answers of a project"),
+        BotCommand("search", "Search past prompts and answers"),
+        BotCommand("loopstats", "Show event loop lag and the worst blocking calls"),
+        BotCommand("memstats", "Show memory usage and the top allocation sites"),
         BotCommand("checklogin", "Check if the bot is logged in to Claude"),
     ]
-    await application.bot.set_my_commands(commands)
-    scheduler.start()
+    for attempt in range(SET_COMMANDS_ATTEMPTS):
+        try:
+            await application.bot.set_my_commands(commands)
+            return
+        except TelegramError as e:
+            print(f"Failed to register the bot commands (attempt {attempt + 1}): {e}")
+            await asyncio.sleep(2**attempt * 5)
+
 
+async def start_scheduler():
+    """Starts the scheduler and its maintenance jobs, independently of command registration."""
+    try:
+        scheduler = await asyncio.to_thread(get_scheduler)
+        if not scheduler.running:
+            scheduler.start()
+    except Exception as e:
+        print(f"Failed to start the scheduler, scheduled messages will not run: {e}")
+        raise
+    deferred_queue.restore()
+    scheduler.add_job(
+        prune_sessions,
+        trigger="interval",
+        hours=6,
+        id="prune_sessions",
+        replace_existing=True,
+    )
     if settings.DATABASE_URL:
-        from claudebot.tools.logger import Base, engine
+        run_in_background(index_search_backlog())
+        scheduler.add_job(
+            prune_logs,
+            trigger="interval",
+            hours=24,
+            id="prune_logs",
+            replace_existing=True,
+        )
+
+
+MB = 1024 * 1024
+# A local Bot API server lifts the public API's 20 MB download and 50 MB upload caps
+MAX_DOWNLOAD_SIZE = (2000 if settings.TELEGRAM_LOCAL_MODE else 20) * MB
+MAX_UPLOAD_SIZE = (2000 if settings.TELEGRAM_LOCAL_MODE else 50) * MB
 
-        async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
 
+def http_version() -> str:
+    if settings.TELEGRAM_HTTP_VERSION.startswith("2") and not importlib.util.find_spec("h2"):
+        print("HTTP/2 needs the h2 package (pip install 'httpx[http2]'), falling back to HTTP/1.1")
+        return "1.1"
+    return settings.TELEGRAM_HTTP_VERSION
 
-app = (
-    ApplicationBuilder()
-    .token(settings.TELEGRAM_BOT_TOKEN)
-    .post_init(setup_commands)
-    .concurrent_updates(True)
-    .build()
-)
 
-MAX_MESSAGE_LENGTH = 4096
+def build_application():
+    """Builds the bot with the HTTP client settings and, if set, a self-hosted Bot API server.
+
+    With `TELEGRAM_LOCAL_MODE` the server hands out files as local paths, so
+    voice notes and documents are read from disk instead of downloaded.
+    """
+    version = http_version()
+    builder = (
+        ApplicationBuilder()
+        .token(settings.TELEGRAM_BOT_TOKEN)
+        .post_init(post_init)
+        .concurrent_updates(PerChatUpdateProcessor())
+        .connection_pool_size(settings.TELEGRAM_POOL_SIZE)
+        .connect_timeout(settings.TELEGRAM_CONNECT_TIMEOUT)
+        .read_timeout(settings.TELEGRAM_READ_TIMEOUT)
+        .write_timeout(settings.TELEGRAM_WRITE_TIMEOUT)
+        .pool_timeout(settings.TELEGRAM_POOL_TIMEOUT)
+        .media_write_timeout(settings.TELEGRAM_MEDIA_WRITE_TIMEOUT)
+        .http_version(version)
+        .get_updates_connect_timeout(settings.TELEGRAM_CONNECT_TIMEOUT)
+        .get_updates_pool_timeout(settings.TELEGRAM_POOL_TIMEOUT)
+        .get_updates_http_version(version)
+    )
+    if settings.TELEGRAM_API_URL:
+        root = settings.TELEGRAM_API_URL.rstrip("/")
+        builder = builder.base_url(f"{root}/bot").base_file_url(f"{root}/file/bot")
+    if settings.TELEGRAM_LOCAL_MODE:
+        builder = builder.local_mode(True)
+    return builder.build()
+
+
+app = build_application()
+
+MAX_MESSAGE_CHUNKS = 10
+
+
+async def send_markdown(bot, chat_id: int, message: str, **kwargs):
+    """Sends CommonMark as Telegram HTML, one message per chunk, falling back to plain text"""
+    kwargs.pop("parse_mode", None)
+    reply_markup = kwargs.pop("reply_markup", None)
+    chunks = render_markdown(message)
+    omitted = 0
+    if len(chunks) > MAX_MESSAGE_CHUNKS:
+        omitted = len(chunks) - MAX_MESSAGE_CHUNKS // 2
+        chunks = chunks[: MAX_MESSAGE_CHUNKS // 2]
+    sent = None
+    for index, chunk in enumerate(chunks):
+        if index == len(chunks) - 1 and not omitted:
+            kwargs["reply_markup"] = reply_markup
+        try:
+            sent = await bot.send_message(
+                chat_id=chat_id, text=chunk, parse_mode=ParseMode.HTML, **kwargs
+            )
+        except BadRequest as e:
+            print(f"Failed to send rendered message, falling back to plain text: {e}")
+            sent = await bot.send_message(
+                chat_id=chat_id, text=to_plain_text(chunk), **kwargs
+            )
+    if omitted:
+        sent = await send_text_document(
+            bot,
+            chat_id,
+            message,
+            "answer.md",
+            caption=f"{omitted} more messages, the full answer is attached.",
+            reply_markup=reply_markup,
+            **kwargs,
+        )
+    return sent
+
+
+async def send_text_document(bot, chat_id: int, text: str, filename: str, **kwargs):
+    """Sends text as a file, cut to the upload limit of the Bot API server."""
+    data = text.encode("utf-8")
+    if len(data) > MAX_UPLOAD_SIZE:
+        data = data[: MAX_UPLOAD_SIZE - MB] + b"\n... truncated ...\n"
+    return await bot.send_document(chat_id=chat_id, document=data, filename=filename, **kwargs)
+
 
 async def send_message(
-    update: Update, context: ContextTypes.DEFAULT_TYPE, message: str, **kwargs
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    message: str,
+    commonmark: bool = False,
+    **kwargs,
 ):
+    if commonmark and update.effective_chat:
+        return await send_markdown(context.bot, update.effective_chat.id, message, **kwargs)
+
     if len(message) > MAX_MESSAGE_LENGTH:
         truncate_length = (MAX_MESSAGE_LENGTH - 10) // 2
         message = message[:truncate_length] + "\n...\n" + message[-truncate_length:]
@@ -64,10 +294,29 @@ async def send_message(
         )
     return await update.message.reply_text(message, **kwargs)
 
-async def send_direct_message(chat_id: int, message: str, **kwargs):
+
+def progress_editor(message, title: str, limit: int = 500):
+    """Returns a callback that replaces the text of `message` with the latest progress line."""
+
+    async def report(line: str):
+        if not message:
+            return
+        try:
+            text = f"{title}\n{line[-limit:]}" if title else line[-limit:]
+            await message.edit_text(text)
+        except TelegramError as e:
+            print(f"Failed to edit progress message: {e}")
+
+    return report
+
+
+async def send_direct_message(chat_id: int, message: str, commonmark: bool = False, **kwargs):
+    print(f"Sending message to chat {chat_id}\n")
+    if commonmark:
+        return await send_markdown(app.bot, chat_id, message, **kwargs)
+
     if len(message) > MAX_MESSAGE_LENGTH:
         truncate_length = (MAX_MESSAGE_LENGTH - 10) // 2
         message = message[:truncate_length] + "\n...\n" + message[-truncate_length:]
 
-    print(f"Sending message to chat {chat_id}\n")
-    return await app.bot.send_message(chat_id=chat_id, text=message, **kwargs)
\ No newline at end of file
+    return await app.bot.send_message(chat_id=chat_id, text=message, **kwargs)
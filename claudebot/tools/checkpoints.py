@@ -0,0 +1,128 @@
+import os
+import shlex
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+
+from claudebot.settings import settings
+from claudebot.tools.git import _git_dirs
+from claudebot.tools.shell import run_command, run_command_split
+
+CHECKPOINT_NAMESPACE = "refs/claudebot/checkpoints"
+
+
+@dataclass
+class Checkpoint:
+    ref: str
+    created_at: float
+    subject: str
+
+
+def checkpoint_prefix(project: str) -> str:
+    return f"{CHECKPOINT_NAMESPACE}/{project}/"
+
+
+async def _git(cmd: str, cwd: str, env: str = "") -> str:
+    ret_code, output, error = await run_command_split(f"{env}git {cmd}", cwd=cwd)
+    if ret_code != 0:
+        raise ValueError(f"git {cmd.split()[0]} failed with code {ret_code}:\n{error or output}")
+    return output.strip()
+
+
+async def create_checkpoint(project_path: str, project: str, label: str) -> str | None:
+    """Snapshots HEAD, the index and the working tree, untracked files included.
+
+    The snapshot is a commit like the ones `git stash` writes: its tree is the
+    working tree, its first parent HEAD and its second parent a commit of the
+    index. Untracked files are added through a copy of the index, so the real
+    index and the working tree are never touched. Returns the ref, or None when
+    the repository has no commit yet.
+    """
+    ret_code, head, _ = await run_command_split("git rev-parse --verify -q HEAD", cwd=project_path)
+    if ret_code != 0:
+        return None
+    head = head.strip()
+    _, branch, _ = await run_command_split("git symbolic-ref -q HEAD", cwd=project_path)
+    git_dir, _ = _git_dirs(project_path)
+    index_tree = await _git("write-tree", project_path)
+    with tempfile.TemporaryDirectory() as tmp:
+        index_copy = os.path.join(tmp, "index")
+        if os.path.exists(os.path.join(git_dir, "index")):
+            shutil.copy2(os.path.join(git_dir, "index"), index_copy)
+        env = f"GIT_INDEX_FILE={shlex.quote(index_copy)} "
+        await _git("add -A", project_path, env)
+        worktree_tree = await _git("write-tree", project_path, env)
+    index_commit = await _git(
+        f"commit-tree {index_tree} -p {head} -m {shlex.quote('index')}", project_path
+    )
+    # One line, so the prompt cannot reach the body that holds the head trailer
+    subject = " ".join(label.split())[:100]
+    message = f"claudebot checkpoint: {subject}\n\nhead: {branch.strip() or head}"
+    checkpoint = await _git(
+        f"commit-tree {worktree_tree} -p {head} -p {index_commit} -m {shlex.quote(message)}",
+        project_path,
+    )
+    ref = f"{checkpoint_prefix(project)}{time.time_ns() // 1_000_000}"
+    await _git(f"update-ref {shlex.quote(ref)} {checkpoint}", project_path)
+    await prune_checkpoints(project_path, project)
+    return ref
+
+
+async def list_checkpoints(project_path: str, project: str) -> list[Checkpoint]:
+    """Returns the checkpoints of a project, newest first."""
+    ret_code, output, _ = await run_command_split(
+        "git for-each-ref --format='%(refname)%09%(subject)' "
+        + shlex.quote(checkpoint_prefix(project)),
+        cwd=project_path,
+    )
+    if ret_code != 0:
+        return []
+    checkpoints = []
+    for line in output.splitlines():
+        ref, _, subject = line.partition("\t")
+        stamp = ref.rsplit("/", 1)[-1]
+        if stamp.isdigit():
+            checkpoints.append(
+                Checkpoint(ref, int(stamp) / 1000, subject.removeprefix("claudebot checkpoint: "))
+            )
+    checkpoints.sort(key=lambda checkpoint: checkpoint.created_at, reverse=True)
+    return checkpoints
+
+
+async def prune_checkpoints(project_path: str, project: str) -> int:
+    """Deletes the checkpoints beyond `CHECKPOINT_KEEP` or older than `CHECKPOINT_MAX_AGE_DAYS`."""
+    checkpoints = await list_checkpoints(project_path, project)
+    cutoff = time.time() - settings.CHECKPOINT_MAX_AGE_DAYS * 86400
+    expired = [
+        checkpoint
+        for position, checkpoint in enumerate(checkpoints)
+        if (settings.CHECKPOINT_KEEP > 0 and position >= settings.CHECKPOINT_KEEP)
+        or (settings.CHECKPOINT_MAX_AGE_DAYS > 0 and checkpoint.created_at < cutoff)
+    ]
+    for checkpoint in expired:
+        await run_command(f"git update-ref -d {shlex.quote(checkpoint.ref)}", cwd=project_path)
+    return len(expired)
+
+
+async def restore_checkpoint(project_path: str, ref: str):
+    """Restores the branch, the index and the working tree recorded by a checkpoint.
+
+    Runs locally only: the objects are all in the repository. Ignored files are
+    left alone, every other file not in the checkpoint is removed.
+    """
+    commit = await _git(f"rev-parse --verify {shlex.quote(ref + '^{commit}')}", project_path)
+    head = await _git(f"rev-parse {commit}^1", project_path)
+    body = await _git(f"log -1 --format=%b {commit}", project_path)
+    # Checkpoints taken before labels were collapsed may carry prompt paragraphs before it
+    heads = [line for line in body.splitlines() if line.startswith("head: ")]
+    recorded = heads[-1].removeprefix("head: ").strip() if heads else ""
+    if recorded.startswith("refs/heads/"):
+        branch = shlex.quote(recorded.removeprefix("refs/heads/"))
+        await _git(f"checkout -f {branch}", project_path)
+        await _git(f"reset --hard {head}", project_path)
+    else:
+        await _git(f"checkout -f --detach {head}", project_path)
+    await _git("clean -fd", project_path)
+    await _git(f"read-tree -u --reset {commit}", project_path)
+    await _git(f"read-tree {commit}^2", project_path)
@@ -1,18 +1,30 @@
 import asyncio
+import contextlib
+import os
 import shlex
+import signal
 
-from claudebot.tools.json_models import ClaudeAuthResponse
+from pydantic import ValidationError
+
+from claudebot.tools.json_models import ClaudeAuthResponse, ClaudeResult
+from claudebot.tools.procstats import ProcessUsage, watch_session
 from claudebot.tools.shell import run_command
 from claudebot.settings import settings
 
+KILL_GRACE_SECONDS = 5
+
 
 class Claude:
     cwd: str
     process: asyncio.subprocess.Process | None
+    result: ClaudeResult | None
+    usage: ProcessUsage | None
 
     def __init__(self, cwd: str):
         self.cwd = cwd
         self.process = None
+        self.result = None
+        self.usage = None
 
     @staticmethod
     async def check_login():
@@ -25,35 +37,75 @@ class Claude:
         
 
     async def send(
-        self, message: str, resume_session: bool = False, plan_mode: bool = False
+        self,
+        message: str,
+        resume_session: bool = False,
+        plan_mode: bool = False,
+        session_id: str | None = None,
+        append_system_prompt: str | None = None,
+        model: str | None = None,
+        effort: str | None = None,
     ) -> tuple[int, str]:
         escaped_message = shlex.quote(message)
-        cmd = f"claude --dangerously-skip-permissions"
-        if settings.MODEL:
-            cmd += f" --model {settings.MODEL}"
-        if settings.EFFORT:
-            cmd += f" --effort {settings.EFFORT}"
+        model = model or settings.MODEL
+        effort = effort or settings.EFFORT
+        cmd = f"claude --dangerously-skip-permissions --output-format json"
+        if model:
+            cmd += f" --model {shlex.quote(model)}"
+        if effort:
+            cmd += f" --effort {shlex.quote(effort)}"
         if plan_mode:
             cmd += f" --permission-mode plan"
-        if resume_session:
+        if append_system_prompt:
+            cmd += f" --append-system-prompt {shlex.quote(append_system_prompt)}"
+        if session_id:
+            cmd += f" --resume {shlex.quote(session_id)}"
+        elif resume_session:
             cmd += f" -c"
         cmd += f" -p {escaped_message}"
-        self.process = await asyncio.create_subprocess_shell(
-            cmd,
+        # exec replaces the shell, and the new session makes claude the leader of
+        # a process group holding every tool it spawns, so kill() reaches them all
+        process = self.process = await asyncio.create_subprocess_shell(
+            f"exec {cmd}",
             cwd=self.cwd,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
         )
-        stdout, stderr = await self.process.communicate()
+        self.usage = ProcessUsage()
+        sampler = asyncio.create_task(watch_session(process.pid, self.usage))
+        try:
+            stdout, stderr = await process.communicate()
+        finally:
+            sampler.cancel()
         if stderr:
             print(
                 f"Error from Claude process: {stderr.decode('utf-8', errors='ignore')}"
             )
         res = stdout.decode("utf-8", errors="ignore").strip()
-        return self.process.returncode or 0, res
+        try:
+            self.result = ClaudeResult.model_validate_json(res)
+            res = self.result.result
+        except ValidationError:
+            self.result = None
+        return process.returncode or 0, res
 
     async def kill(self):
-        if self.process:
-            self.process.kill()
-            await self.process.wait()
-            self.process = None
+        """Terminates the whole process group, with SIGKILL for what outlives `KILL_GRACE_SECONDS`."""
+        if not self.process:
+            return
+        process, self.process = self.process, None
+        self._signal_group(process.pid, signal.SIGTERM)
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(process.wait(), KILL_GRACE_SECONDS)
+        # Also reaches children that ignored SIGTERM after claude itself exited
+        self._signal_group(process.pid, signal.SIGKILL)
+        await process.wait()
+
+    @staticmethod
+    def _signal_group(pgid: int, sig: int):
+        try:
+            os.killpg(pgid, sig)
+        except ProcessLookupError:
+            pass
+
@@ -1,12 +1,22 @@
+import asyncio
+
 from claudebot.tools.claude import Claude
 
 class Context:
     def __init__(self):
         self.claude_sessions: dict[str, Claude] = {}
         self.current_project: str | None = None
+        self.selected_sessions: dict[str, str] = {}
+        self.project_locks: dict[str, asyncio.Lock] = {}
 
     def set_current_project(self, project_name: str):
         self.current_project = project_name
 
+    def project_lock(self, project: str) -> asyncio.Lock:
+        """Serializes git operations and Claude runs on the same checkout."""
+        if project not in self.project_locks:
+            self.project_locks[project] = asyncio.Lock()
+        return self.project_locks[project]
+
     
 ctx = Context()
\ No newline at end of file
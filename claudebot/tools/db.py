@@ -0,0 +1,420 @@
+import asyncio
+import gzip
+import hashlib
+import re
+import sqlite3
+from datetime import date, datetime
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base, mapped_column, Mapped
+from sqlalchemy import DateTime, Text, BigInteger, Float, Index, LargeBinary, String, bindparam, cast, func, inspect, text
+from sqlalchemy.dialects.postgresql import REGCONFIG, TSVECTOR
+
+from claudebot.settings import settings
+
+engine = create_async_engine(
+    settings.DATABASE_URL,  # type: ignore
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    pool_size=5,
+)
+
+Session = async_sessionmaker(engine, expire_on_commit=False, autoflush=False, autocommit=False)
+
+Base = declarative_base()
+
+# Monthly range partitions need created_at in the primary key, so the models
+# switch to a composite key when partitioning is on
+PARTITIONED = bool(settings.LOG_PARTITIONING) and engine.dialect.name == "postgresql"
+PARTITIONED_TABLES = ("claudebot_logs", "claude_response_logs")
+
+
+def _log_table_args(*indexes: Index) -> tuple:
+    if PARTITIONED:
+        return (*indexes, {"postgresql_partition_by": "RANGE (created_at)"})
+    return indexes
+
+
+class ClaudebotLog(Base):
+    __tablename__ = "claudebot_logs"
+    __table_args__ = _log_table_args(
+        Index("ix_claudebot_logs_project_created_at", "project", "created_at"),
+        Index("ix_claudebot_logs_user_id_created_at", "user_id", "created_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    project: Mapped[str | None]
+    user_id: Mapped[int | None] = mapped_column(BigInteger)
+    username: Mapped[str | None]
+    first_name: Mapped[str | None]
+    last_name: Mapped[str | None]
+    lang: Mapped[str | None]
+    is_bot: Mapped[bool | None]
+    is_premium: Mapped[bool | None]
+    chat_id: Mapped[int | None] = mapped_column(BigInteger)
+    chat_type: Mapped[str | None]
+    forwarded_origin: Mapped[str | None]
+    web_app_data: Mapped[str | None]
+    message_id: Mapped[int | None]
+    message: Mapped[str | None] = mapped_column(Text)
+    # False for commands, button presses, picker filters and unauthorized messages; None on older rows
+    is_prompt: Mapped[bool | None]
+    timestamp: Mapped[datetime | None]
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        primary_key=PARTITIONED,
+        nullable=False,
+        default=lambda: datetime.now().astimezone(),
+        server_default=func.now(),
+    )
+
+
+class ClaudeResponseLog(Base):
+    __tablename__ = "claude_response_logs"
+    __table_args__ = _log_table_args(
+        Index("ix_claude_response_logs_project_created_at", "project", "created_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    project: Mapped[str | None]
+    # Only set on rows written before responses moved to claude_response_blobs
+    response: Mapped[str | None] = mapped_column(Text)
+    response_sha256: Mapped[str | None] = mapped_column(String(64), index=True)
+    created_at: Mapped[DateTime] = mapped_column(
+        DateTime(timezone=True),
+        primary_key=PARTITIONED,
+        nullable=False,
+        default=lambda: datetime.now().astimezone(),
+        server_default=func.now(),
+    )
+
+
+class ClaudeResponseBlob(Base):
+    """A compressed response, stored once per distinct content."""
+
+    __tablename__ = "claude_response_blobs"
+
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    codec: Mapped[str] = mapped_column(String(16))
+    size: Mapped[int]
+    data: Mapped[bytes] = mapped_column(LargeBinary)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now().astimezone(),
+        server_default=func.now(),
+    )
+
+
+class ClaudeUsageLog(Base):
+    __tablename__ = "claude_usage_logs"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    project: Mapped[str | None]
+    session_id: Mapped[str | None]
+    is_error: Mapped[bool]
+    input_tokens: Mapped[int]
+    output_tokens: Mapped[int]
+    cache_creation_input_tokens: Mapped[int]
+    cache_read_input_tokens: Mapped[int]
+    cost_usd: Mapped[float] = mapped_column(Float)
+    num_turns: Mapped[int]
+    duration_ms: Mapped[int]
+    tier: Mapped[str | None]
+    model: Mapped[str | None]
+    latency_ms: Mapped[int | None]
+    peak_rss_kb: Mapped[int | None]
+    cpu_ms: Mapped[int | None]
+    child_count: Mapped[int | None]
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now().astimezone(),
+        server_default=func.now(),
+    )
+
+
+# Full-text search uses a tsvector column on PostgreSQL and an FTS5 table on SQLite
+SEARCH_DIALECT = engine.dialect.name if engine.dialect.name in ("postgresql", "sqlite") else None
+SEARCH_FTS_TABLE = "claude_search_fts"
+# PostgreSQL rejects a tsvector over 1 MB; a few hundred thousand characters stay well under it
+SEARCH_MAX_CHARS = 250_000
+
+
+def _search_table_args() -> tuple:
+    indexes = [
+        Index("ix_claude_search_documents_kind_log_id", "kind", "log_id", unique=True),
+        Index("ix_claude_search_documents_project_created_at", "project", "created_at"),
+    ]
+    if SEARCH_DIALECT == "postgresql":
+        indexes.append(Index("ix_claude_search_documents_tsv", "tsv", postgresql_using="gin"))
+    return tuple(indexes)
+
+
+class SearchDocument(Base):
+    """The full-text index entry of a logged prompt or response.
+
+    The text itself stays in the log tables; PostgreSQL keeps its lexemes in
+    `tsv`, SQLite in the `claude_search_fts` table under the same rowid.
+    """
+
+    __tablename__ = "claude_search_documents"
+    __table_args__ = _search_table_args()
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(16))
+    log_id: Mapped[int] = mapped_column(BigInteger)
+    project: Mapped[str | None]
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        index=True,
+        default=lambda: datetime.now().astimezone(),
+        server_default=func.now(),
+    )
+    if SEARCH_DIALECT == "postgresql":
+        tsv = mapped_column(TSVECTOR)
+
+
+def ensure_search_index(conn):
+    """Creates the FTS5 table on SQLite.
+
+    It is contentless where SQLite supports deleting from contentless tables
+    (3.43+), so the text is not stored twice; older versions keep a copy.
+    """
+    if SEARCH_DIALECT != "sqlite":
+        return
+    tokenizer = "unicode61 remove_diacritics 2"
+    if settings.SEARCH_LANGUAGE == "english":
+        tokenizer = f"porter {tokenizer}"
+    options = ", content='', contentless_delete=1" if sqlite3.sqlite_version_info >= (3, 43) else ""
+    conn.execute(
+        text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_FTS_TABLE} "
+            f"USING fts5(body, tokenize='{tokenizer}'{options})"
+        )
+    )
+
+
+_schema_ready = False
+_schema_lock = asyncio.Lock()
+
+
+def _add_missing_columns(conn):
+    """Adds the nullable columns and indexes that create_all skips on existing tables."""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+async def init_db():
+    global _schema_ready
+    if _schema_ready:
+        return
+    async with _schema_lock:
+        if not _schema_ready:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+                await conn.run_sync(_add_missing_columns)
+                await conn.run_sync(ensure_partitions)
+                await conn.run_sync(ensure_search_index)
+            _schema_ready = True
+
+
+def _month_start(day: date, offset: int = 0) -> date:
+    month = day.year * 12 + day.month - 1 + offset
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def _is_partitioned(conn, table: str) -> bool:
+    return bool(
+        conn.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                "WHERE c.relname = :table"
+            ),
+            {"table": table},
+        ).first()
+    )
+
+
+def ensure_partitions(conn, months_ahead: int = 1):
+    """Creates the monthly partitions up to next month, plus a default one, on partitioned tables.
+
+    Tables created before partitioning was turned on stay unpartitioned.
+    """
+    if not PARTITIONED:
+        return
+    today = date.today()
+    for table in PARTITIONED_TABLES:
+        if not _is_partitioned(conn, table):
+            continue
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+        for offset in range(months_ahead + 1):
+            start, end = _month_start(today, offset), _month_start(today, offset + 1)
+            conn.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {table}_y{start:%Y}m{start:%m} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                )
+            )
+
+
+def drop_expired_partitions(conn, table: str, cutoff: datetime) -> int:
+    """Drops the monthly partitions that end before `cutoff`, returning how many were dropped."""
+    if not PARTITIONED or not _is_partitioned(conn, table):
+        return 0
+    partitions = conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :table"
+        ),
+        {"table": table},
+    ).scalars()
+    dropped = 0
+    for name in partitions:
+        suffix = name[len(table) + 1 :]
+        if len(suffix) != 8 or not suffix.startswith("y") or suffix[5] != "m":
+            continue
+        start = date(int(suffix[1:5]), int(suffix[6:8]), 1)
+        if _month_start(start, 1) <= cutoff.date():
+            conn.execute(text(f"DROP TABLE {name}"))
+            dropped += 1
+    return dropped
+
+
+def compress_response(response: str) -> tuple[str, str, bytes]:
+    """Returns the sha256, codec and compressed bytes of a response."""
+    raw = response.encode("utf-8")
+    return hashlib.sha256(raw).hexdigest(), "gzip", gzip.compress(raw, compresslevel=6)
+
+
+def decompress_response(codec: str, data: bytes) -> str:
+    if codec != "gzip":
+        raise ValueError(f"Unknown response codec: {codec}")
+    return gzip.decompress(data).decode("utf-8")
+
+
+async def store_response_blob(session, response: str) -> str:
+    """Stores the response unless the same content is already stored, returning its sha256."""
+    sha256, codec, data = compress_response(response)
+    values = {"sha256": sha256, "codec": codec, "size": len(response), "data": data}
+    dialect = engine.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        await session.execute(insert(ClaudeResponseBlob).values(**values).on_conflict_do_nothing())
+    elif not await session.get(ClaudeResponseBlob, sha256):
+        session.add(ClaudeResponseBlob(**values))
+    return sha256
+
+
+async def load_response(session, log: ClaudeResponseLog) -> str:
+    if log.response is not None or not log.response_sha256:
+        return log.response or ""
+    blob = await session.get(ClaudeResponseBlob, log.response_sha256)
+    return decompress_response(blob.codec, blob.data) if blob else ""
+
+
+def _search_config():
+    return cast(settings.SEARCH_LANGUAGE, REGCONFIG)
+
+
+async def index_document(
+    session, kind: str, log_id: int, project: str | None, created_at: datetime, body: str
+):
+    """Adds a prompt or response to the full-text index, in the caller's transaction."""
+    if not SEARCH_DIALECT or not body:
+        return
+    document = SearchDocument(kind=kind, log_id=log_id, project=project, created_at=created_at)
+    if SEARCH_DIALECT == "postgresql":
+        document.tsv = func.to_tsvector(_search_config(), body[:SEARCH_MAX_CHARS])
+    session.add(document)
+    await session.flush()
+    if SEARCH_DIALECT == "sqlite":
+        await session.execute(
+            text(f"INSERT INTO {SEARCH_FTS_TABLE}(rowid, body) VALUES (:id, :body)"),
+            {"id": document.id, "body": body},
+        )
+
+
+async def delete_documents(session, kind: str, cutoff: datetime) -> int:
+    """Removes the index entries of the `kind` rows created before `cutoff`."""
+    from sqlalchemy import delete
+
+    if not SEARCH_DIALECT:
+        return 0
+    expired = (SearchDocument.kind == kind, SearchDocument.created_at < cutoff)
+    if SEARCH_DIALECT == "sqlite":
+        await session.execute(
+            text(
+                f"DELETE FROM {SEARCH_FTS_TABLE} WHERE rowid IN (SELECT id FROM claude_search_documents "
+                f"WHERE kind = :kind AND created_at < :cutoff)"
+            ).bindparams(bindparam("cutoff", type_=DateTime(timezone=True))),
+            {"kind": kind, "cutoff": cutoff},
+        )
+    result = await session.execute(delete(SearchDocument).where(*expired))
+    return result.rowcount
+
+
+def fts5_query(query: str) -> str:
+    """Quotes every word, so user input never hits the FTS5 query syntax."""
+    return " ".join(f'"{word}"' for word in re.findall(r"\w+", query))
+
+
+async def search_documents(
+    session, query: str, project: str | None, limit: int, offset: int = 0
+) -> list[tuple[str, int, str | None, datetime]]:
+    """Returns (kind, log_id, project, created_at) of the best matches, best first."""
+    from sqlalchemy import select
+
+    if SEARCH_DIALECT == "postgresql":
+        tsquery = func.websearch_to_tsquery(_search_config(), query)
+        statement = (
+            select(
+                SearchDocument.kind,
+                SearchDocument.log_id,
+                SearchDocument.project,
+                SearchDocument.created_at,
+            )
+            .where(SearchDocument.tsv.op("@@")(tsquery))
+            .order_by(
+                func.ts_rank_cd(SearchDocument.tsv, tsquery).desc(),
+                SearchDocument.created_at.desc(),
+            )
+            .limit(limit)
+            .offset(offset)
+        )
+        if project:
+            statement = statement.where(SearchDocument.project == project)
+        return [tuple(row) for row in (await session.execute(statement)).all()]
+    if SEARCH_DIALECT == "sqlite":
+        match = fts5_query(query)
+        if not match:
+            return []
+        statement = text(
+            f"SELECT d.kind, d.log_id, d.project, d.created_at FROM {SEARCH_FTS_TABLE} "
+            f"JOIN claude_search_documents d ON d.id = {SEARCH_FTS_TABLE}.rowid "
+            f"WHERE {SEARCH_FTS_TABLE} MATCH :match"
+            + (" AND d.project = :project" if project else "")
+            + f" ORDER BY bm25({SEARCH_FTS_TABLE}), d.created_at DESC LIMIT :limit OFFSET :offset"
+        ).columns(
+            SearchDocument.kind,
+            SearchDocument.log_id,
+            SearchDocument.project,
+            SearchDocument.created_at,
+        )
+        params = {"match": match, "project": project, "limit": limit, "offset": offset}
+        return [tuple(row) for row in (await session.execute(statement, params)).all()]
+    return []
@@ -0,0 +1,284 @@
+import asyncio
+import json
+import os
+import re
+from collections import Counter
+from typing import AsyncIterator
+
+from claudebot.settings import settings
+from claudebot.tools.git import _git_dirs
+from claudebot.tools.shell import run_command_split
+from claudebot.tools.sparse import in_cone, sparse_directories
+
+DIGEST_VERSION = 1
+MAX_SYMBOL_FILE_SIZE = 200 * 1024
+MAX_SYMBOLS_PER_FILE = 15
+RECENT_COMMITS = 10
+TREE_DEPTH = 2
+
+LANGUAGES = {
+    ".py": "Python",
+    ".js": "JavaScript",
+    ".jsx": "JavaScript",
+    ".mjs": "JavaScript",
+    ".ts": "TypeScript",
+    ".tsx": "TypeScript",
+    ".go": "Go",
+    ".rs": "Rust",
+    ".java": "Java",
+    ".kt": "Kotlin",
+    ".rb": "Ruby",
+    ".php": "PHP",
+    ".cs": "C#",
+    ".c": "C",
+    ".h": "C",
+    ".cpp": "C++",
+    ".hpp": "C++",
+    ".swift": "Swift",
+    ".sh": "Shell",
+    ".sql": "SQL",
+}
+
+SYMBOL_PATTERNS = {
+    "Python": re.compile(r"^(?:async\s+)?(?:def|class)\s+(\w+)", re.MULTILINE),
+    "JavaScript": re.compile(
+        r"^export\s+(?:default\s+)?(?:async\s+)?(?:function\*?|class|const|let)\s+(\w+)", re.MULTILINE
+    ),
+    "TypeScript": re.compile(
+        r"^export\s+(?:default\s+)?(?:abstract\s+)?(?:async\s+)?"
+        r"(?:function\*?|class|const|let|interface|type|enum)\s+(\w+)",
+        re.MULTILINE,
+    ),
+    "Go": re.compile(r"^(?:func(?:\s+\([^)]*\))?|type)\s+([A-Z]\w*)", re.MULTILINE),
+    "Rust": re.compile(r"^pub\s+(?:async\s+)?(?:fn|struct|enum|trait)\s+(\w+)", re.MULTILINE),
+    "Java": re.compile(r"^public\s+(?:final\s+|abstract\s+)*(?:class|interface|enum|record)\s+(\w+)", re.MULTILINE),
+    "Kotlin": re.compile(r"^(?:data\s+|sealed\s+|open\s+)?(?:class|interface|object|fun)\s+(\w+)", re.MULTILINE),
+    "Ruby": re.compile(r"^\s*(?:class|module|def)\s+([\w:.]+)", re.MULTILINE),
+}
+
+ENTRY_POINT_NAMES = {
+    "main.py",
+    "__main__.py",
+    "app.py",
+    "manage.py",
+    "wsgi.py",
+    "asgi.py",
+    "main.go",
+    "main.rs",
+    "lib.rs",
+    "index.js",
+    "index.ts",
+    "main.js",
+    "main.ts",
+    "server.js",
+    "server.ts",
+    "package.json",
+    "pyproject.toml",
+    "setup.py",
+    "Cargo.toml",
+    "go.mod",
+    "pom.xml",
+    "build.gradle",
+    "Makefile",
+    "Dockerfile",
+    "docker-compose.yml",
+}
+
+
+def extract_symbols(language: str, content: str) -> list[str]:
+    pattern = SYMBOL_PATTERNS.get(language)
+    if not pattern:
+        return []
+    symbols = []
+    for name in pattern.findall(content):
+        if name not in symbols and not name.startswith("_"):
+            symbols.append(name)
+    return symbols[:MAX_SYMBOLS_PER_FILE]
+
+
+def _cat_file(project_path: str, mode: str):
+    return asyncio.create_subprocess_exec(
+        "git",
+        "cat-file",
+        mode,
+        cwd=project_path,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+
+
+async def blob_sizes(project_path: str, shas: list[str]) -> dict[str, int]:
+    """Reads the sizes of blobs in one `git cat-file --batch-check` process, without their contents."""
+    if not shas:
+        return {}
+    process = await _cat_file(project_path, "--batch-check")
+    output, _ = await process.communicate("\n".join(shas).encode() + b"\n")
+    sizes = {}
+    for line in output.decode().splitlines():
+        fields = line.split()
+        if len(fields) == 3 and fields[1] == "blob":
+            sizes[fields[0]] = int(fields[2])
+    return sizes
+
+
+async def read_blobs(project_path: str, shas: list[str]) -> AsyncIterator[tuple[str, bytes]]:
+    """Streams blobs from one `git cat-file --batch` process, one at a time.
+
+    Only blobs of at most `MAX_SYMBOL_FILE_SIZE` are requested, so memory stays
+    bounded whatever the size of the change.
+    """
+    sizes = await blob_sizes(project_path, shas)
+    wanted = [sha for sha in shas if sizes.get(sha, MAX_SYMBOL_FILE_SIZE + 1) <= MAX_SYMBOL_FILE_SIZE]
+    if not wanted:
+        return
+    process = await _cat_file(project_path, "--batch")
+    assert process.stdin and process.stdout
+
+    async def feed():
+        for sha in wanted:
+            process.stdin.write(f"{sha}\n".encode())
+            await process.stdin.drain()
+        process.stdin.close()
+
+    # Written while the output is read, so a full stdout pipe cannot block the writes
+    feeder = asyncio.create_task(feed())
+    try:
+        while header := await process.stdout.readline():
+            fields = header.split()
+            if len(fields) < 3:
+                continue
+            content = await process.stdout.readexactly(int(fields[2]) + 1)
+            yield fields[0].decode(), content[:-1]
+        await feeder
+    finally:
+        feeder.cancel()
+        if process.returncode is None:
+            process.kill()
+        await process.wait()
+
+
+def _tree_summary(paths: list[str]) -> list[str]:
+    counts: Counter[str] = Counter()
+    for path in paths:
+        parts = path.split("/")[:-1][:TREE_DEPTH]
+        for depth in range(1, len(parts) + 1):
+            counts["/".join(parts[:depth]) + "/"] += 1
+    root_files = sorted(path for path in paths if "/" not in path)
+    lines = [f"{directory} ({count} files)" for directory, count in sorted(counts.items())]
+    return lines + root_files
+
+
+class RepoDigest:
+    """Builds a compact description of a repository to prime fresh Claude sessions.
+
+    The digest is cached in the git common dir per HEAD. Symbols are cached per
+    blob sha, so a new HEAD only reads the files that changed.
+    """
+
+    def __init__(self):
+        self.locks: dict[str, asyncio.Lock] = {}
+
+    @staticmethod
+    def cache_path(project_path: str) -> str:
+        _, common_dir = _git_dirs(project_path)
+        return os.path.join(common_dir, "claudebot", "digest.json")
+
+    def _load(self, project_path: str) -> dict:
+        try:
+            with open(self.cache_path(project_path)) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return cache if cache.get("version") == DIGEST_VERSION else {}
+
+    def _save(self, project_path: str, cache: dict):
+        path = self.cache_path(project_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(cache, f)
+        os.replace(f"{path}.tmp", path)
+
+    async def get(self, project_path: str) -> str | None:
+        lock = self.locks.setdefault(project_path, asyncio.Lock())
+        async with lock:
+            ret_code, head, _ = await run_command_split("git rev-parse HEAD", cwd=project_path)
+            if ret_code != 0:
+                return None
+            head = head.strip()
+            sparse = await sparse_directories(project_path)
+            cache = await asyncio.to_thread(self._load, project_path)
+            if cache.get("head") == head and cache.get("sparse") == sparse:
+                return cache["text"]
+            ret_code, tree, _ = await run_command_split("git ls-tree -r -z HEAD", cwd=project_path)
+            if ret_code != 0:
+                return None
+            files = await self._update_files(project_path, tree, cache.get("files", {}), sparse)
+            text = await self._render(project_path, files)
+            cache = {
+                "version": DIGEST_VERSION,
+                "head": head,
+                "sparse": sparse,
+                "files": files,
+                "text": text,
+            }
+            await asyncio.to_thread(self._save, project_path, cache)
+            return text
+
+    async def _update_files(
+        self, project_path: str, tree: str, cached: dict, sparse: list[str] | None = None
+    ) -> dict:
+        files: dict[str, list] = {}
+        changed: dict[str, list[str]] = {}
+        for entry in tree.split("\0"):
+            if not entry:
+                continue
+            meta, path = entry.split("\t", 1)
+            _, kind, sha = meta.split()
+            # Files outside the sparse cone are not checked out, and with a partial
+            # clone reading them would fetch their blobs
+            if kind != "blob" or (sparse is not None and not in_cone(path, sparse)):
+                continue
+            previous = cached.get(path)
+            if previous and previous[0] == sha:
+                files[path] = previous
+                continue
+            files[path] = [sha, []]
+            if os.path.splitext(path)[1] in LANGUAGES:
+                changed.setdefault(sha, []).append(path)
+        async for sha, content in read_blobs(project_path, list(changed)):
+            text = content.decode("utf-8", errors="ignore")
+            for path in changed[sha]:
+                files[path][1] = extract_symbols(LANGUAGES[os.path.splitext(path)[1]], text)
+        return files
+
+    async def _render(self, project_path: str, files: dict) -> str:
+        paths = sorted(files)
+        languages = Counter(
+            LANGUAGES[ext] for ext in (os.path.splitext(path)[1] for path in paths) if ext in LANGUAGES
+        )
+        _, log, _ = await run_command_split(
+            f"git log --oneline -n {RECENT_COMMITS}", cwd=project_path
+        )
+        sections = [
+            "# Repository digest",
+            "Precomputed overview of this repository at the current HEAD. "
+            "Use it to orient yourself before exploring the files.",
+            f"## Languages\n{', '.join(f'{name} ({count} files)' for name, count in languages.most_common())}",
+            "## Entry points\n"
+            + "\n".join(path for path in paths if os.path.basename(path) in ENTRY_POINT_NAMES),
+            "## Recent commits\n" + log.strip(),
+            "## File tree\n" + "\n".join(_tree_summary(paths)),
+        ]
+        symbols = "\n".join(
+            f"{path}: {', '.join(files[path][1])}" for path in paths if files[path][1]
+        )
+        if symbols:
+            sections.append("## Key symbols\n" + symbols)
+        text = "\n\n".join(sections)
+        if len(text) > settings.REPO_DIGEST_MAX_CHARS:
+            text = text[: settings.REPO_DIGEST_MAX_CHARS].rsplit("\n", 1)[0] + "\n..."
+        return text
+
+
+repo_digest = RepoDigest()
@@ -0,0 +1,373 @@
+import hashlib
+import os
+import re
+import shlex
+import time
+from dataclasses import dataclass, field
+
+from claudebot.settings import settings
+from claudebot.tools.shell import run_command, run_command_split, stream_command
+
+STATUS_TOP_PATHS = 15
+STEP_OUTPUT_LENGTH = 800
+MIRROR_PATH = os.path.join(settings.projects_dir, "_mirrors", "shared.git")
+CLONE_USAGE = (
+    "Usage: /gclone [--filter=blob:none] [--depth N] [--single-branch] "
+    "[--branch NAME] [--mirror|--no-mirror] [--sparse[=DIR,...|=@PROFILE]] <repo_url>"
+)
+
+
+@dataclass
+class GitStatusSummary:
+    branch: str = ""
+    upstream: str = ""
+    ahead: int = 0
+    behind: int = 0
+    staged: int = 0
+    modified: int = 0
+    renamed: int = 0
+    conflicted: int = 0
+    untracked: int = 0
+    paths: list[tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return len(self.paths)
+
+
+def parse_porcelain_v2(output: str) -> GitStatusSummary:
+    """Parses `git status --porcelain=v2 --branch -z` output."""
+    summary = GitStatusSummary()
+    entries = output.split("\0")
+    index = 0
+    while index < len(entries):
+        entry = entries[index]
+        index += 1
+        if not entry:
+            continue
+        if entry.startswith("# "):
+            key, _, value = entry[2:].partition(" ")
+            if key == "branch.head":
+                summary.branch = value
+            elif key == "branch.upstream":
+                summary.upstream = value
+            elif key == "branch.ab":
+                ahead, behind = value.split()
+                summary.ahead, summary.behind = int(ahead), -int(behind)
+            continue
+        kind = entry[0]
+        if kind == "?":
+            summary.untracked += 1
+            summary.paths.append(("??", entry[2:]))
+        elif kind == "u":
+            summary.conflicted += 1
+            summary.paths.append(("UU", entry.split(" ", 10)[10]))
+        elif kind in ("1", "2"):
+            fields = entry.split(" ", 9 if kind == "2" else 8)
+            xy = fields[1]
+            if xy[0] != ".":
+                summary.staged += 1
+            if xy[1] != ".":
+                summary.modified += 1
+            path = fields[-1]
+            if kind == "2":
+                summary.renamed += 1
+                # The original path of a rename is the next NUL separated field
+                path = f"{entries[index]} -> {path}"
+                index += 1
+            summary.paths.append((xy.replace(".", " "), path))
+    return summary
+
+
+def format_status(summary: GitStatusSummary, top: int = STATUS_TOP_PATHS) -> str:
+    lines = [f"On {summary.branch or 'unknown branch'}"]
+    if summary.upstream:
+        lines[0] += f" -> {summary.upstream} (ahead {summary.ahead}, behind {summary.behind})"
+    if not summary.paths:
+        lines.append("Working tree clean")
+        return "\n".join(lines)
+    counts = [
+        ("staged", summary.staged),
+        ("modified", summary.modified),
+        ("renamed", summary.renamed),
+        ("conflicted", summary.conflicted),
+        ("untracked", summary.untracked),
+    ]
+    lines.append(", ".join(f"{count} {name}" for name, count in counts if count))
+    lines.append("")
+    lines.extend(f"{code} {path}" for code, path in summary.paths[:top])
+    if summary.total > top:
+        lines.append(f"... and {summary.total - top} more")
+    return "\n".join(lines)
+
+
+def _git_dirs(project_path: str) -> tuple[str, str]:
+    """Returns the git dir and the common dir, which differ for linked worktrees."""
+    git_dir = os.path.join(project_path, ".git")
+    if os.path.isfile(git_dir):
+        with open(git_dir) as f:
+            git_dir = os.path.join(project_path, f.read().split(":", 1)[1].strip())
+    common_dir = git_dir
+    if os.path.isfile(os.path.join(git_dir, "commondir")):
+        with open(os.path.join(git_dir, "commondir")) as f:
+            common_dir = os.path.join(git_dir, f.read().strip())
+    return git_dir, common_dir
+
+
+def _mtime(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def status_cache_key(project_path: str) -> tuple:
+    git_dir, common_dir = _git_dirs(project_path)
+    try:
+        with open(os.path.join(git_dir, "HEAD")) as f:
+            head = f.read().strip()
+    except OSError:
+        head = ""
+    ref_mtime = 0
+    if head.startswith("ref: "):
+        ref_mtime = _mtime(os.path.join(common_dir, head[5:])) or _mtime(
+            os.path.join(common_dir, "packed-refs")
+        )
+    return head, ref_mtime, _mtime(os.path.join(git_dir, "index"))
+
+
+class GitStatusCache:
+    """Caches status summaries by index mtime and HEAD.
+
+    Edits that do not touch the index are not visible in the key, so entries
+    also expire after `GIT_STATUS_CACHE_TTL` seconds and are invalidated after
+    Claude runs and git commands.
+    """
+
+    def __init__(self):
+        self.entries: dict[str, tuple[tuple, float, GitStatusSummary]] = {}
+        self.tuned: set[str] = set()
+
+    def invalidate(self, project_path: str):
+        self.entries.pop(project_path, None)
+
+    async def get(self, project_path: str) -> GitStatusSummary:
+        if project_path not in self.tuned:
+            self.tuned.add(project_path)
+            await enable_fast_status(project_path)
+        key = status_cache_key(project_path)
+        cached = self.entries.get(project_path)
+        if cached and cached[0] == key and time.time() - cached[1] < settings.GIT_STATUS_CACHE_TTL:
+            return cached[2]
+        ret_code, output, error = await run_command_split(
+            "git status --porcelain=v2 --branch -z", cwd=project_path
+        )
+        if ret_code != 0:
+            raise ValueError(f"Git status failed with code {ret_code}:\n{error}")
+        summary = parse_porcelain_v2(output)
+        # Read the key again: status may refresh the index it just stat'ed
+        self.entries[project_path] = (status_cache_key(project_path), time.time(), summary)
+        return summary
+
+
+git_status_cache = GitStatusCache()
+
+
+async def enable_fast_status(project_path: str):
+    """Turns on the untracked cache, and fsmonitor where git supports it, on large repositories."""
+    if settings.GIT_FAST_STATUS_MIN_FILES <= 0:
+        return
+    ret_code, output = await run_command("git ls-files | wc -l", cwd=project_path)
+    if ret_code != 0 or int(output.strip() or 0) < settings.GIT_FAST_STATUS_MIN_FILES:
+        return
+    await run_command("git config core.untrackedCache true", cwd=project_path)
+    ret_code, _ = await run_command("git config --get core.fsmonitor", cwd=project_path)
+    if ret_code == 0:
+        return
+    _, build_options = await run_command("git version --build-options")
+    if "fsmonitor--daemon" in build_options:
+        await run_command("git config core.fsmonitor true", cwd=project_path)
+
+
+@dataclass
+class PipelineStep:
+    name: str
+    cmd: str
+    required: bool = True
+    ret_code: int | None = None
+    output: str = ""
+    duration: float = 0
+
+
+class GitPipeline:
+    """Runs git commands in order, stopping at the first required step that fails."""
+
+    def __init__(self, title: str, steps: list[PipelineStep]):
+        self.title = title
+        self.steps = steps
+
+    @property
+    def ok(self) -> bool:
+        return all(
+            step.ret_code is not None and (step.ret_code == 0 or not step.required)
+            for step in self.steps
+        )
+
+    async def run(self, cwd: str) -> bool:
+        for step in self.steps:
+            start = time.perf_counter()
+            step.ret_code, step.output = await run_command(step.cmd, cwd=cwd)
+            step.duration = time.perf_counter() - start
+            if step.ret_code != 0 and step.required:
+                break
+        return self.ok
+
+    def report(self) -> str:
+        failed = next(
+            (s for s in self.steps if s.ret_code and s.required), None
+        )
+        lines = [
+            f"{self.title} failed at {failed.name}:" if failed else f"{self.title} successful:"
+        ]
+        for step in self.steps:
+            if step.ret_code is None:
+                lines.append(f"⏭ {step.name}")
+                continue
+            icon = "✅" if step.ret_code == 0 else "❌" if step.required else "⚠️"
+            lines.append(f"{icon} {step.name} ({step.duration:.2f}s)")
+            output = step.output.strip()
+            if output:
+                if len(output) > STEP_OUTPUT_LENGTH:
+                    output = "..." + output[-STEP_OUTPUT_LENGTH:]
+                lines.append(output)
+        return "\n".join(lines)
+
+
+@dataclass
+class CloneOptions:
+    url: str
+    filter: str | None = None
+    depth: int | None = None
+    single_branch: bool = False
+    branch: str | None = None
+    mirror: bool = False
+    # None clones every file; a list, possibly empty, clones the root files plus these cone entries
+    sparse: list[str] | None = None
+
+
+def normalize_repo_url(url: str) -> str:
+    if url.startswith(("https://", "http://", "ssh://", "file://", "git@", "/")):
+        return url
+    return f"git@github.com:{url}"
+
+
+def parse_clone_args(args: list[str]) -> CloneOptions:
+    """Parses /gclone arguments, raising ValueError with the usage on bad input."""
+    options = CloneOptions(url="", mirror=settings.GIT_MIRROR_CACHE)
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg.startswith("--filter="):
+            options.filter = arg.split("=", 1)[1]
+        elif arg == "--filter" and args:
+            options.filter = args.pop(0)
+        elif arg == "--depth" and args and args[0].isdigit():
+            options.depth = int(args.pop(0))
+        elif arg.startswith("--depth=") and arg[8:].isdigit():
+            options.depth = int(arg[8:])
+        elif arg == "--single-branch":
+            options.single_branch = True
+        elif arg in ("--branch", "-b") and args:
+            options.branch = args.pop(0)
+        elif arg == "--mirror":
+            options.mirror = True
+        elif arg == "--no-mirror":
+            options.mirror = False
+        elif arg == "--sparse":
+            options.sparse = []
+        elif arg.startswith("--sparse="):
+            options.sparse = [entry for entry in arg[9:].split(",") if entry]
+        elif not arg.startswith("-") and not options.url:
+            options.url = normalize_repo_url(arg)
+        else:
+            raise ValueError(f"Unexpected argument: {arg}\n{CLONE_USAGE}")
+    if not options.url:
+        raise ValueError(f"Please specify a repository URL. {CLONE_USAGE}")
+    return options
+
+
+def clone_command(options: CloneOptions, reference: str | None = None) -> str:
+    cmd = ["git", "clone", "--progress"]
+    if options.filter:
+        cmd.append(f"--filter={options.filter}")
+    if options.depth:
+        cmd += ["--depth", str(options.depth)]
+    if options.single_branch:
+        cmd.append("--single-branch")
+    if options.branch:
+        cmd += ["--branch", options.branch]
+    if reference:
+        cmd += ["--reference-if-able", reference]
+    if options.sparse is not None:
+        cmd.append("--sparse")
+    cmd += ["--", options.url, clone_directory(options.url)]
+    return shlex.join(cmd)
+
+
+def clone_directory(url: str) -> str:
+    """The directory git clone picks for `url`: its last path component without `.git`."""
+    name = url.rstrip("/").removesuffix("/.git").removesuffix(".git")
+    return re.split(r"[/:]", name)[-1]
+
+
+def mirror_remote(url: str) -> str:
+    return "r" + hashlib.sha1(url.encode()).hexdigest()[:12]
+
+
+async def update_mirror(url: str, on_progress=None) -> tuple[int, str]:
+    """Fetches `url` into the shared bare mirror, one remote per URL.
+
+    Forks of the same repository share their objects in the mirror, so only
+    the commits a fork adds are transferred. Clones borrow the objects through
+    alternates, which is why the mirror never runs gc and never prunes.
+    """
+    if not os.path.isdir(MIRROR_PATH):
+        os.makedirs(os.path.dirname(MIRROR_PATH), exist_ok=True)
+        ret_code, output = await run_command(f"git init --bare {shlex.quote(MIRROR_PATH)}")
+        if ret_code != 0:
+            return ret_code, output
+        await run_command("git config gc.auto 0", cwd=MIRROR_PATH)
+    remote = mirror_remote(url)
+    ret_code, _ = await run_command(f"git remote get-url {remote}", cwd=MIRROR_PATH)
+    if ret_code != 0:
+        ret_code, output = await run_command(
+            f"git remote add --no-tags {remote} {shlex.quote(url)}", cwd=MIRROR_PATH
+        )
+        if ret_code != 0:
+            return ret_code, output
+    return await stream_command(
+        f"git fetch --progress {remote}", cwd=MIRROR_PATH, on_progress=on_progress
+    )
+
+
+@dataclass
+class Branch:
+    name: str
+    current: bool = False
+    checked_out: bool = False
+
+
+async def list_branches(project_path: str) -> list[Branch]:
+    """Lists local branches, most recently committed first."""
+    ret_code, output, error = await run_command_split(
+        "git for-each-ref --sort=-committerdate "
+        "--format='%(HEAD)%09%(worktreepath)%09%(refname:short)' refs/heads/",
+        cwd=project_path,
+    )
+    if ret_code != 0:
+        raise ValueError(error or output)
+    branches = []
+    for line in output.splitlines():
+        head, worktree, name = line.split("\t", 2)
+        branches.append(Branch(name, head == "*", bool(worktree)))
+    return branches
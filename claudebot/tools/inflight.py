@@ -0,0 +1,54 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+
+
+@dataclass
+class InFlightRun:
+    chat_id: int
+    project: str
+    message: str
+    started_at: float = field(default_factory=time.time)
+    interrupted: bool = False
+    # Where the run's Claude session lives, when not in ctx.claude_sessions (batch runs)
+    sessions: dict | None = field(default=None, repr=False)
+
+
+class InFlightRuns:
+    """Claude runs that still owe the user an answer.
+
+    On shutdown the bot stops taking prompts (`draining`), waits for these runs
+    to finish, and hands the unfinished ones over to the next process.
+    """
+
+    def __init__(self):
+        self.runs: list[InFlightRun] = []
+        self.draining = False
+        self.deadline = 0.0
+
+    def start(
+        self, chat_id: int, project: str, message: str, sessions: dict | None = None
+    ) -> InFlightRun:
+        run = InFlightRun(chat_id, project, message, sessions=sessions)
+        self.runs.append(run)
+        return run
+
+    def finish(self, run: InFlightRun):
+        if run in self.runs:
+            self.runs.remove(run)
+
+    async def wait(self, timeout: float) -> bool:
+        """Waits until every run is done or the deadline passes; True if none is left."""
+        self.deadline = time.monotonic() + timeout
+        while self.runs and time.monotonic() < self.deadline:
+            await asyncio.sleep(0.5)
+        return not self.runs
+
+    def interrupt(self) -> list[InFlightRun]:
+        runs, self.runs = self.runs, []
+        for run in runs:
+            run.interrupted = True
+        return runs
+
+
+inflight_runs = InFlightRuns()
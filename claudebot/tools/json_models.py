@@ -14,4 +14,22 @@ class ClaudeAuthResponse(CamelcaseModel):
     auth_method: str
     org_id: str | None = None
     org_name: str | None = None
-    subscription_type: str | None = None
\ No newline at end of file
+    subscription_type: str | None = None
+
+
+class ClaudeUsage(BaseModel):
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+
+
+class ClaudeResult(BaseModel):
+    subtype: str | None = None
+    is_error: bool = False
+    result: str = ""
+    session_id: str | None = None
+    num_turns: int = 0
+    duration_ms: int = 0
+    total_cost_usd: float = 0
+    usage: ClaudeUsage = ClaudeUsage()
@@ -0,0 +1,158 @@
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import ContextTypes
+
+from claudebot.tools.bot import send_message
+
+PAGE_SIZE = 8
+MAX_TOKENS = 4096
+MAX_LABEL_LENGTH = 60
+# A filter request the user ignored must not swallow a prompt sent much later
+PENDING_FILTER_TIMEOUT = 120
+
+
+class CallbackTokens:
+    """Maps short opaque tokens to server-side values, evicting the least recently used.
+
+    Telegram limits callback data to 64 bytes, so buttons carry a token instead
+    of a branch, project or job name. A token evicted or lost on restart
+    resolves to None and the user is asked to open the menu again.
+    """
+
+    def __init__(self, size: int = MAX_TOKENS):
+        self.size = size
+        self.values: OrderedDict[str, Any] = OrderedDict()
+
+    def put(self, value: Any) -> str:
+        token = secrets.token_hex(4)
+        self.values[token] = value
+        if len(self.values) > self.size:
+            self.values.popitem(last=False)
+        return token
+
+    def get(self, token: str) -> Any:
+        value = self.values.get(token)
+        if value is not None:
+            self.values.move_to_end(token)
+        return value
+
+
+callback_tokens = CallbackTokens()
+
+EXPIRED_MENU_MESSAGE = "This menu has expired. Please run the command again."
+
+
+@dataclass
+class Picker:
+    """A paginated, filterable list of items whose buttons call back with `<action>_<token>`.
+
+    `items` are (label, value) pairs, already sorted; the value is what the
+    action handler receives through `callback_tokens`.
+    """
+
+    action: str
+    title: str
+    items: list[tuple[str, Any]]
+    query: str = ""
+    page: int = 0
+    token: str = field(default="", init=False)
+
+    def __post_init__(self):
+        self.token = callback_tokens.put(self)
+
+    @property
+    def matches(self) -> list[tuple[str, Any]]:
+        if not self.query:
+            return self.items
+        query = self.query.lower()
+        return [item for item in self.items if query in item[0].lower()]
+
+    @property
+    def text(self) -> str:
+        if self.query:
+            return f"{self.title} (filter: {self.query}, {len(self.matches)} matches)"
+        return self.title
+
+    def markup(self) -> InlineKeyboardMarkup:
+        matches = self.matches
+        pages = max(1, -(-len(matches) // PAGE_SIZE))
+        self.page = min(max(0, self.page), pages - 1)
+        start = self.page * PAGE_SIZE
+        keyboard = [
+            [
+                InlineKeyboardButton(
+                    label if len(label) <= MAX_LABEL_LENGTH else label[: MAX_LABEL_LENGTH - 1] + "…",
+                    callback_data=f"{self.action}_{callback_tokens.put(value)}",
+                )
+            ]
+            for label, value in matches[start : start + PAGE_SIZE]
+        ]
+        navigation = []
+        if self.page > 0:
+            navigation.append(
+                InlineKeyboardButton("◀", callback_data=f"picker_{self.token}_page_{self.page - 1}")
+            )
+        if pages > 1:
+            navigation.append(
+                InlineKeyboardButton(f"{self.page + 1}/{pages}", callback_data=f"picker_{self.token}_noop")
+            )
+        if self.page < pages - 1:
+            navigation.append(
+                InlineKeyboardButton("▶", callback_data=f"picker_{self.token}_page_{self.page + 1}")
+            )
+        if navigation:
+            keyboard.append(navigation)
+        if len(self.items) > PAGE_SIZE or self.query:
+            row = [InlineKeyboardButton("🔎 Filter", callback_data=f"picker_{self.token}_filter")]
+            if self.query:
+                row.append(InlineKeyboardButton("✖ Clear", callback_data=f"picker_{self.token}_clear"))
+            keyboard.append(row)
+        return InlineKeyboardMarkup(keyboard)
+
+
+async def send_picker(update: Update, context: ContextTypes.DEFAULT_TYPE, picker: Picker):
+    await send_message(update, context, picker.text, reply_markup=picker.markup())
+
+
+def request_filter(context: ContextTypes.DEFAULT_TYPE, picker: Picker):
+    """Makes the next text message, if sent within `PENDING_FILTER_TIMEOUT`, the picker's filter."""
+    if context.user_data is not None:
+        context.user_data["pending_picker"] = (picker.token, time.monotonic())
+
+
+def has_pending_filter(context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """Tells whether the next text message will be taken as a picker filter."""
+    pending = context.user_data.get("pending_picker") if context.user_data else None
+    return bool(pending) and time.monotonic() - pending[1] <= PENDING_FILTER_TIMEOUT
+
+
+def clear_pending_filter(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Drops the pending filter request when a command or a button press comes in instead."""
+    if not context.user_data:
+        return
+    text = update.message.text if update.message else None
+    if update.callback_query or (text and text.startswith("/")):
+        context.user_data.pop("pending_picker", None)
+
+
+async def apply_pending_filter(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """Filters the picker waiting for a query with the message text; False if none was waiting."""
+    pending = context.user_data.pop("pending_picker", None) if context.user_data else None
+    if not pending or not update.message or not update.message.text:
+        return False
+    token, requested_at = pending
+    if time.monotonic() - requested_at > PENDING_FILTER_TIMEOUT:
+        return False
+    picker = callback_tokens.get(token)
+    if not picker:
+        await send_message(update, context, EXPIRED_MENU_MESSAGE)
+        return True
+    picker.query = update.message.text.strip()
+    picker.page = 0
+    await send_picker(update, context, picker)
+    return True
@@ -0,0 +1,156 @@
+import asyncio
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from claudebot.settings import settings
+from claudebot.tools.scheduler import get_scheduler
+
+LIMIT_MESSAGE = "You've hit your limit"
+RESET_PATTERN = re.compile(r"resets (\d{1,2})(?::(\d{2}))?\s*(am|pm)", re.IGNORECASE)
+
+
+def parse_limit_reset(response: str) -> datetime | None:
+    if LIMIT_MESSAGE not in response:
+        return None
+    match = RESET_PATTERN.search(response)
+    if not match:
+        return None
+    hour = int(match.group(1)) % 12
+    if match.group(3).lower() == "pm":
+        hour += 12
+    minute = int(match.group(2) or 0)
+    now = datetime.now()
+    reset_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if reset_at <= now:
+        reset_at += timedelta(days=1)
+    return reset_at
+
+
+# Referenced by name: the jobs outlive the process and handlers import this module
+DRAIN_JOB = "claudebot.handlers.claude_handlers:drain_deferred_prompts"
+DRAIN_JOB_ID = "drain_deferred_prompts"
+DEFERRED_JOB = "claudebot.handlers.claude_handlers:process_claude_prompt_and_answer"
+DEFERRED_JOB_PREFIX = "deferred_prompt_"
+
+
+@dataclass
+class DeferredPrompt:
+    chat_id: int
+    message: str
+    project: str
+    job_id: str = ""
+
+
+class DeferredQueue:
+    """Prompts held back while the Claude usage limit is reached.
+
+    Each prompt is also kept as a paused job in the scheduler's job store, so
+    the queue survives a restart: `restore` loads it back when the scheduler
+    starts. The paused jobs never fire, `drain` runs the prompts.
+    """
+
+    def __init__(self):
+        self.items: list[DeferredPrompt] = []
+        self.limited_until: datetime | None = None
+
+    @property
+    def limited(self) -> bool:
+        return self.limited_until is not None and datetime.now() < self.limited_until
+
+    def defer(self, prompt: DeferredPrompt):
+        self.items.append(prompt)
+        self.persist(prompt)
+
+    def persist(self, prompt: DeferredPrompt):
+        if not prompt.job_id:
+            prompt.job_id = f"{DEFERRED_JOB_PREFIX}{time.time_ns()}"
+        get_scheduler().add_job(
+            DEFERRED_JOB,
+            trigger="date",
+            run_date=self.limited_until or datetime.now(),
+            args=[prompt.chat_id, prompt.message, prompt.project],
+            id=prompt.job_id,
+            next_run_time=None,
+            replace_existing=True,
+        )
+
+    def forget(self, prompt: DeferredPrompt):
+        from apscheduler.jobstores.base import JobLookupError
+
+        try:
+            get_scheduler().remove_job(prompt.job_id)
+        except JobLookupError:
+            pass
+
+    def schedule_drain(self, reset_at: datetime):
+        """Runs the queue at `reset_at`, or as soon as the bot is back up if it is down then."""
+        self.limited_until = reset_at
+        get_scheduler().add_job(
+            DRAIN_JOB,
+            trigger="date",
+            run_date=reset_at,
+            id=DRAIN_JOB_ID,
+            replace_existing=True,
+            misfire_grace_time=None,
+        )
+
+    def restore(self):
+        """Loads the prompts deferred before a restart; call once the scheduler is running."""
+        scheduler = get_scheduler()
+        queued = {prompt.job_id for prompt in self.items}
+        jobs = sorted(
+            (job for job in scheduler.get_jobs() if job.id.startswith(DEFERRED_JOB_PREFIX)),
+            key=lambda job: job.id,
+        )
+        self.items = [
+            DeferredPrompt(*job.args, job_id=job.id) for job in jobs if job.id not in queued
+        ] + self.items
+        drain = scheduler.get_job(DRAIN_JOB_ID)
+        if drain and drain.next_run_time:
+            self.limited_until = drain.next_run_time.astimezone().replace(tzinfo=None)
+        elif self.items:
+            # The drain already ran, or was lost with the process that set it
+            self.schedule_drain(datetime.now())
+
+    async def drain(self, run: Callable[[DeferredPrompt], Awaitable[bool]]):
+        """Runs the queued prompts in order, one project at a time.
+
+        `run` returns True when the prompt hit the limit again, in which case
+        it and the rest of its project stay queued for the next reset. A prompt
+        whose run raises is kept queued the same way, so one failure never
+        drops the other prompts. A prompt leaves the job store when it starts,
+        since a shutdown from then on resumes it as an in-flight run.
+        """
+        pending, self.items = self.items, []
+        by_project: dict[str, list[DeferredPrompt]] = {}
+        for prompt in pending:
+            by_project.setdefault(prompt.project, []).append(prompt)
+        semaphore = asyncio.Semaphore(max(1, settings.DEFERRED_CONCURRENCY))
+        leftovers: list[DeferredPrompt] = []
+
+        async def run_project(prompts: list[DeferredPrompt]):
+            async with semaphore:
+                for position, prompt in enumerate(prompts):
+                    if self.limited:
+                        leftovers.extend(prompts[position:])
+                        return
+                    self.forget(prompt)
+                    try:
+                        limited = await run(prompt)
+                    except Exception as e:
+                        print(f"Deferred prompt for {prompt.project} failed: {e}")
+                        limited = True
+                    if limited:
+                        self.persist(prompt)
+                        leftovers.extend(prompts[position:])
+                        return
+
+        await asyncio.gather(*(run_project(prompts) for prompts in by_project.values()))
+        leftover_ids = {id(prompt) for prompt in leftovers}
+        self.items = [p for p in pending if id(p) in leftover_ids] + self.items
+
+
+deferred_queue = DeferredQueue()
@@ -1,123 +1,559 @@
+import hashlib
 import logging
 import json
-from datetime import datetime
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 from claudebot.settings import settings
 from telegram import Update
 from claudebot.tools.context import ctx
+from claudebot.tools.json_models import ClaudeResult
+from claudebot.tools.procstats import ProcessUsage
+from claudebot.tools.routing import Route
 
 logging.basicConfig(level=logging.INFO)
 
-if settings.DATABASE_URL:
-    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-    from sqlalchemy.orm import declarative_base, mapped_column, Mapped
-    from sqlalchemy import DateTime, Text, BigInteger, func
+# The database layer (SQLAlchemy) is only imported by the first log call that needs it
 
-    engine = create_async_engine(
-        settings.DATABASE_URL,
-        pool_pre_ping=True,
-        pool_recycle=1800,
-        pool_size=5,
+
+@dataclass
+class UsageTotals:
+    runs: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost_usd: float = 0
+    num_turns: int = 0
+    duration_ms: int = 0
+
+
+usage_totals: dict[str, UsageTotals] = {}
+
+
+@dataclass
+class TierLatency:
+    runs: int = 0
+    latency_ms: int = 0
+    max_latency_ms: int = 0
+
+    @property
+    def average_ms(self) -> float:
+        return self.latency_ms / self.runs if self.runs else 0
+
+
+tier_latency: dict[tuple[str, str], TierLatency] = {}
+
+RESPONSE_PREVIEW_LENGTH = 200
+
+
+async def log(update: Update, prompt: bool = True) -> None:
+    """Logs an update; its text counts as a prompt only if `prompt` and the user typed it.
+
+    A button press carries the bot's own message, so its callback data is logged instead.
+    """
+    user = update.effective_user
+    chat = update.effective_chat
+    msg = update.effective_message
+    query = update.callback_query
+    text = update.message.text if update.message else None
+
+    log_data = {
+        "project": ctx.current_project,
+        "user_id": user.id if user else None,
+        "username": user.username if user else None,
+        "first_name": user.first_name if user else None,
+        "last_name": user.last_name if user else None,
+        "lang": user.language_code if user else None,
+        "is_bot": user.is_bot if user else None,
+        "is_premium": user.is_premium if user else None,
+        "chat_id": chat.id if chat else None,
+        "chat_type": chat.type if chat else None,
+        "forwarded_origin": msg.forward_origin.type if msg and msg.forward_origin else None,
+        "web_app_data": msg.web_app_data.data if msg and msg.web_app_data else None,
+        "message": text or (query.data if query else None),
+        "is_prompt": bool(prompt and text and not text.startswith("/")),
+        "timestamp": msg.date if msg else None,
+    }
+
+    if not settings.DATABASE_URL:
+        if log_data["timestamp"]:
+            log_data["timestamp"] = log_data["timestamp"].isoformat()
+        logging.info(f"Received message:\n{json.dumps(log_data, indent=2)}")
+        return
+
+    from claudebot.tools.db import ClaudebotLog, Session, index_document, init_db
+
+    await init_db()
+    async with Session() as session:
+        entry = ClaudebotLog(**log_data)
+        session.add(entry)
+        if entry.is_prompt:
+            await session.flush()
+            await index_document(
+                session, "prompt", entry.id, entry.project, entry.created_at, entry.message
+            )
+        await session.commit()
+
+
+async def log_claude_response(project: str, response: str) -> None:
+    if not settings.DATABASE_URL:
+        # The answer was already sent to the chat, so only log enough to identify it
+        digest = hashlib.sha256(response.encode("utf-8")).hexdigest()
+        preview = " ".join(response[:RESPONSE_PREVIEW_LENGTH].split())
+        logging.info(
+            f"Claude response for project {project}: {len(response)} chars, "
+            f"sha256 {digest[:12]}: {preview}"
+        )
+        return
+
+    from claudebot.tools.db import (
+        ClaudeResponseLog,
+        Session,
+        index_document,
+        init_db,
+        store_response_blob,
     )
 
-    Session = async_sessionmaker(engine, expire_on_commit=False, autoflush=False, autocommit=False)
-
-    Base = declarative_base()
-
-    class ClaudebotLog(Base):
-        __tablename__ = "claudebot_logs"
-
-        id: Mapped[int] = mapped_column(primary_key=True)
-        project: Mapped[str | None]
-        user_id: Mapped[int | None] = mapped_column(BigInteger)
-        username: Mapped[str | None]
-        first_name: Mapped[str | None]
-        last_name: Mapped[str | None]
-        lang: Mapped[str | None]
-        is_bot: Mapped[bool | None]
-        is_premium: Mapped[bool | None]
-        chat_id: Mapped[int | None] = mapped_column(BigInteger)
-        chat_type: Mapped[str | None]
-        forwarded_origin: Mapped[str | None]
-        web_app_data: Mapped[str | None]
-        message_id: Mapped[int | None] 
-        message: Mapped[str | None] = mapped_column(Text)
-        timestamp: Mapped[datetime | None]
-        created_at: Mapped[datetime] = mapped_column(
-            DateTime(timezone=True),
-            nullable=False,
-            default=lambda: datetime.now().astimezone(),
-            server_default=func.now(),
+    await init_db()
+    async with Session() as session:
+        sha256 = await store_response_blob(session, response)
+        entry = ClaudeResponseLog(project=project, response_sha256=sha256)
+        session.add(entry)
+        await session.flush()
+        await index_document(session, "response", entry.id, project, entry.created_at, response)
+        await session.commit()
+
+
+async def log_claude_usage(
+    project: str,
+    result: ClaudeResult,
+    route: Route | None = None,
+    latency_ms: int | None = None,
+    process_usage: ProcessUsage | None = None,
+) -> None:
+    if not settings.DATABASE_URL:
+        if route and latency_ms is not None:
+            latency = tier_latency.setdefault((route.tier, route.model), TierLatency())
+            latency.runs += 1
+            latency.latency_ms += latency_ms
+            latency.max_latency_ms = max(latency.max_latency_ms, latency_ms)
+        totals = usage_totals.setdefault(project, UsageTotals())
+        totals.runs += 1
+        totals.input_tokens += result.usage.input_tokens
+        totals.output_tokens += result.usage.output_tokens
+        totals.cost_usd += result.total_cost_usd
+        totals.num_turns += result.num_turns
+        totals.duration_ms += result.duration_ms
+        logging.info(
+            f"Claude usage for project {project}: {result.usage.model_dump_json()}, "
+            f"cost ${result.total_cost_usd:.4f}, {result.num_turns} turns, {result.duration_ms} ms"
+            + (f", {process_usage.summary()}" if process_usage else "")
         )
+        return
 
-    class ClaudeResponseLog(Base):
-        __tablename__ = "claude_response_logs"
-
-        id: Mapped[int] = mapped_column(primary_key=True)
-        project: Mapped[str | None]
-        response: Mapped[str | None] = mapped_column(Text)
-        created_at: Mapped[DateTime] = mapped_column(
-            DateTime(timezone=True),
-            nullable=False,
-            default=lambda: datetime.now().astimezone(),
-            server_default=func.now(),
+    from claudebot.tools.db import ClaudeUsageLog, Session, init_db
+
+    await init_db()
+    async with Session() as session:
+        session.add(
+            ClaudeUsageLog(
+                project=project,
+                session_id=result.session_id,
+                is_error=result.is_error,
+                input_tokens=result.usage.input_tokens,
+                output_tokens=result.usage.output_tokens,
+                cache_creation_input_tokens=result.usage.cache_creation_input_tokens,
+                cache_read_input_tokens=result.usage.cache_read_input_tokens,
+                cost_usd=result.total_cost_usd,
+                num_turns=result.num_turns,
+                duration_ms=result.duration_ms,
+                tier=route.tier if route else None,
+                model=route.model if route else None,
+                latency_ms=latency_ms,
+                peak_rss_kb=process_usage.peak_rss_kb if process_usage else None,
+                cpu_ms=process_usage.cpu_ms if process_usage else None,
+                child_count=process_usage.children if process_usage else None,
+            )
         )
+        await session.commit()
+
 
-    async def log(update: Update) -> None:
-        user = update.effective_user
-        chat = update.effective_chat
-        msg = update.effective_message
-        logged_message = ClaudebotLog(
-            project=ctx.current_project,
-            user_id=user.id if user else None,
-            username=user.username if user else None,
-            first_name=user.first_name if user else None,
-            last_name=user.last_name if user else None,
-            lang=user.language_code if user else None,
-            is_bot=user.is_bot if user else None,
-            is_premium=user.is_premium if user else None,
-            chat_id=chat.id if chat else None,
-            chat_type=chat.type if chat else None,
-            forwarded_origin=msg.forward_origin.type if msg and msg.forward_origin else None,
-            web_app_data=msg.web_app_data.data if msg and msg.web_app_data else None,
-            message=msg.text if msg and msg.text else None,
-            timestamp=msg.date if msg else None,
+async def prune_logs():
+    """Applies `LOG_RETENTION_DAYS` to messages and `RESPONSE_RETENTION_DAYS` to responses.
+
+    Partitions entirely older than the cutoff are dropped, the remaining rows
+    are deleted, then the blobs no longer referenced.
+    """
+    if not settings.DATABASE_URL:
+        return
+
+    from sqlalchemy import delete, select
+    from claudebot.tools.db import (
+        ClaudebotLog,
+        ClaudeResponseBlob,
+        ClaudeResponseLog,
+        Session,
+        delete_documents,
+        drop_expired_partitions,
+        engine,
+        ensure_partitions,
+        init_db,
+    )
+
+    await init_db()
+    now = datetime.now().astimezone()
+    async with engine.begin() as conn:
+        await conn.run_sync(ensure_partitions)
+    pruned: dict[str, int] = {}
+    for model, kind, days in (
+        (ClaudebotLog, "prompt", settings.LOG_RETENTION_DAYS),
+        (ClaudeResponseLog, "response", settings.RESPONSE_RETENTION_DAYS),
+    ):
+        if days <= 0:
+            continue
+        cutoff = now - timedelta(days=days)
+        table = model.__tablename__
+        async with engine.begin() as conn:
+            partitions = await conn.run_sync(drop_expired_partitions, table, cutoff)
+        async with Session() as session:
+            result = await session.execute(delete(model).where(model.created_at < cutoff))
+            pruned[f"{kind} search entries"] = await delete_documents(session, kind, cutoff)
+            await session.commit()
+        pruned[table] = result.rowcount
+        if partitions:
+            pruned[f"{table} partitions"] = partitions
+    if settings.RESPONSE_RETENTION_DAYS > 0:
+        referenced = select(ClaudeResponseLog.response_sha256).where(
+            ClaudeResponseLog.response_sha256.is_not(None)
         )
         async with Session() as session:
-            session.add(logged_message)
+            result = await session.execute(
+                delete(ClaudeResponseBlob).where(ClaudeResponseBlob.sha256.not_in(referenced))
+            )
             await session.commit()
+        pruned["claude_response_blobs"] = result.rowcount
+    pruned = {name: count for name, count in pruned.items() if count}
+    if pruned:
+        logging.info(
+            "Pruned logs: " + ", ".join(f"{count} {name}" for name, count in pruned.items())
+        )
+
+
+def prompt_rows_clause():
+    """Matches the ClaudebotLog rows that are prompts typed by the user."""
+    from sqlalchemy import or_
+    from claudebot.tools.db import ClaudebotLog
+
+    return or_(
+        ClaudebotLog.is_prompt.is_(True),
+        # Rows logged before is_prompt existed can only be told apart from commands
+        ClaudebotLog.is_prompt.is_(None) & ~ClaudebotLog.message.startswith("/"),
+    )
+
+
+@dataclass
+class HistoryEntry:
+    created_at: datetime
+    kind: str
+    text: str
+    id: int = 0
+
+
+# Entries logged in the same microsecond are ordered by kind, then id, so a page never splits them
+HISTORY_KINDS = ("prompt", "response")
 
-    async def log_claude_response(project: str, response: str) -> None:
-        logged_response = ClaudeResponseLog(
-            project=project,
-            response=response,
+
+@dataclass
+class HistoryCursor:
+    """The last entry of a history page; the next page starts right after it."""
+
+    created_at: datetime
+    kind: str
+    id: int
+
+
+async def get_history(
+    project: str, limit: int, before: HistoryCursor | None = None
+) -> list[HistoryEntry]:
+    """Returns the latest prompts and responses of a project, newest first.
+
+    Commands, button presses and picker filters are left out. Both queries walk the (project, created_at) indexes
+    and stop after `limit` rows.
+    """
+    from sqlalchemy import select, tuple_
+    from claudebot.tools.db import (
+        ClaudebotLog,
+        ClaudeResponseBlob,
+        ClaudeResponseLog,
+        Session,
+        decompress_response,
+        init_db,
+    )
+
+    await init_db()
+    prompts = (
+        select(ClaudebotLog.id, ClaudebotLog.created_at, ClaudebotLog.message)
+        .where(
+            ClaudebotLog.project == project,
+            ClaudebotLog.message.is_not(None),
+            prompt_rows_clause(),
         )
+        .order_by(ClaudebotLog.created_at.desc(), ClaudebotLog.id.desc())
+        .limit(limit)
+    )
+    responses = (
+        select(
+            ClaudeResponseLog.id,
+            ClaudeResponseLog.created_at,
+            ClaudeResponseLog.response,
+            ClaudeResponseBlob.codec,
+            ClaudeResponseBlob.data,
+        )
+        .outerjoin(ClaudeResponseBlob, ClaudeResponseBlob.sha256 == ClaudeResponseLog.response_sha256)
+        .where(ClaudeResponseLog.project == project)
+        .order_by(ClaudeResponseLog.created_at.desc(), ClaudeResponseLog.id.desc())
+        .limit(limit)
+    )
+    if before:
+        rank = HISTORY_KINDS.index(before.kind)
+        for kind, model in zip(HISTORY_KINDS, (ClaudebotLog, ClaudeResponseLog)):
+            if kind == before.kind:
+                older = tuple_(model.created_at, model.id) < tuple_(before.created_at, before.id)
+            elif HISTORY_KINDS.index(kind) < rank:
+                older = model.created_at <= before.created_at
+            else:
+                older = model.created_at < before.created_at
+            if kind == "prompt":
+                prompts = prompts.where(older)
+            else:
+                responses = responses.where(older)
+    async with Session() as session:
+        prompt_rows = (await session.execute(prompts)).all()
+        response_rows = (await session.execute(responses)).all()
+    entries = [
+        HistoryEntry(created_at, "prompt", message, id) for id, created_at, message in prompt_rows
+    ]
+    for id, created_at, response, codec, data in response_rows:
+        if response is None and data is not None:
+            response = decompress_response(codec, data)
+        entries.append(HistoryEntry(created_at, "response", response or "", id))
+    entries.sort(
+        key=lambda entry: (entry.created_at, HISTORY_KINDS.index(entry.kind), entry.id), reverse=True
+    )
+    return entries[:limit]
+
+
+SEARCH_BACKFILL_BATCH = 500
+SNIPPET_LENGTH = 240
+
+
+async def index_search_backlog() -> int:
+    """Indexes the prompts and responses logged before full-text search existed.
+
+    Walks each log table down from the lowest indexed id, committing every
+    batch, so an interrupted run resumes where it stopped and a finished one
+    costs a single query. Rows that already have a document, such as those
+    indexed on insert while the walk runs, are skipped. Returns how many rows
+    were indexed.
+    """
+    if not settings.DATABASE_URL:
+        return 0
+
+    from sqlalchemy import exists, func, select
+    from claudebot.tools.db import (
+        SEARCH_DIALECT,
+        ClaudebotLog,
+        ClaudeResponseBlob,
+        ClaudeResponseLog,
+        SearchDocument,
+        Session,
+        decompress_response,
+        index_document,
+        init_db,
+    )
+
+    if not SEARCH_DIALECT:
+        return 0
+    await init_db()
+    indexed = 0
+    sources = (
+        (
+            "prompt",
+            ClaudebotLog,
+            select(ClaudebotLog.id, ClaudebotLog.project, ClaudebotLog.created_at, ClaudebotLog.message)
+            .where(ClaudebotLog.message.is_not(None), prompt_rows_clause()),
+        ),
+        (
+            "response",
+            ClaudeResponseLog,
+            select(
+                ClaudeResponseLog.id,
+                ClaudeResponseLog.project,
+                ClaudeResponseLog.created_at,
+                ClaudeResponseLog.response,
+                ClaudeResponseBlob.codec,
+                ClaudeResponseBlob.data,
+            ).outerjoin(
+                ClaudeResponseBlob, ClaudeResponseBlob.sha256 == ClaudeResponseLog.response_sha256
+            ),
+        ),
+    )
+    for kind, model, rows in sources:
         async with Session() as session:
-            session.add(logged_response)
-            await session.commit()
-else:
-    async def log(update: Update) -> None:
-        user = update.effective_user
-        chat = update.effective_chat
-        msg = update.effective_message
-        
-        log_data = {
-            "project": ctx.current_project,
-            "user_id": user.id if user else None,
-            "username": user.username if user else None,
-            "first_name": user.first_name if user else None,
-            "last_name": user.last_name if user else None,
-            "lang": user.language_code if user else None,
-            "is_bot": user.is_bot if user else None,
-            "is_premium": user.is_premium if user else None,
-            "chat_id": chat.id if chat else None,
-            "chat_type": chat.type if chat else None,
-            "forwarded_origin": msg.forward_origin.type if msg and msg.forward_origin else None,
-            "web_app_data": msg.web_app_data.data if msg and msg.web_app_data else None,
-            "message": msg.text if msg and msg.text else None,
-            "timestamp": msg.date.isoformat() if msg and msg.date else None,
-        }
-        
-        logging.info(f"Received message:\n{json.dumps(log_data, indent=2)}")
+            # Rows logged since search was enabled are indexed on insert: only the older ones are missing
+            cursor = await session.scalar(
+                select(func.min(SearchDocument.log_id)).where(SearchDocument.kind == kind)
+            )
+        while True:
+            async with Session() as session:
+                page = rows.where(
+                    ~exists().where(SearchDocument.kind == kind, SearchDocument.log_id == model.id)
+                )
+                if cursor is not None:
+                    page = page.where(model.id < cursor)
+                batch = (
+                    await session.execute(
+                        page.order_by(model.id.desc()).limit(SEARCH_BACKFILL_BATCH)
+                    )
+                ).all()
+                for log_id, project, created_at, body, *blob in batch:
+                    if body is None and blob and blob[1] is not None:
+                        body = decompress_response(blob[0], blob[1])
+                    await index_document(session, kind, log_id, project, created_at, body or "")
+                await session.commit()
+            if not batch:
+                break
+            indexed += len(batch)
+            cursor = batch[-1][0]
+    if indexed:
+        logging.info(f"Indexed {indexed} logged prompts and responses for search")
+    return indexed
+
+
+@dataclass
+class SearchHit:
+    created_at: datetime
+    kind: str
+    project: str | None
+    snippet: str
+
+
+def make_snippet(text: str, query: str, length: int = SNIPPET_LENGTH) -> str:
+    """Cuts `length` characters of `text` around the first word of the query it contains.
+
+    Words also match by their first five letters, to catch the stemmed forms
+    the index matched.
+    """
+    text = " ".join(text.split())
+    lowered = text.lower()
+    positions = []
+    for word in re.findall(r"\w+", query.lower()):
+        for needle in (word, word[:5]):
+            position = lowered.find(needle)
+            if position >= 0:
+                positions.append(position)
+                break
+    start = max(0, min(positions, default=0) - length // 3)
+    snippet = text[start : start + length]
+    return ("..." if start else "") + snippet + ("..." if start + length < len(text) else "")
+
+
+async def search_history(
+    query: str, project: str | None, limit: int, offset: int = 0
+) -> list[SearchHit]:
+    """Returns the prompts and responses best matching `query`, best first."""
+    from sqlalchemy import select
+    from claudebot.tools.db import (
+        ClaudebotLog,
+        ClaudeResponseBlob,
+        ClaudeResponseLog,
+        Session,
+        decompress_response,
+        init_db,
+        search_documents,
+    )
 
-    async def log_claude_response(project: str, response: str) -> None:
-        logging.info(f"Claude response for project {project}:\n{response}")
\ No newline at end of file
+    await init_db()
+    async with Session() as session:
+        matches = await search_documents(session, query, project, limit, offset)
+        prompt_ids = [log_id for kind, log_id, _, _ in matches if kind == "prompt"]
+        response_ids = [log_id for kind, log_id, _, _ in matches if kind == "response"]
+        texts: dict[tuple[str, int], str] = {}
+        if prompt_ids:
+            rows = await session.execute(
+                select(ClaudebotLog.id, ClaudebotLog.message).where(ClaudebotLog.id.in_(prompt_ids))
+            )
+            texts.update((("prompt", log_id), message or "") for log_id, message in rows)
+        if response_ids:
+            rows = await session.execute(
+                select(
+                    ClaudeResponseLog.id,
+                    ClaudeResponseLog.response,
+                    ClaudeResponseBlob.codec,
+                    ClaudeResponseBlob.data,
+                )
+                .outerjoin(
+                    ClaudeResponseBlob, ClaudeResponseBlob.sha256 == ClaudeResponseLog.response_sha256
+                )
+                .where(ClaudeResponseLog.id.in_(response_ids))
+            )
+            for log_id, response, codec, data in rows:
+                if response is None and data is not None:
+                    response = decompress_response(codec, data)
+                texts[("response", log_id)] = response or ""
+    return [
+        SearchHit(created_at, kind, hit_project, make_snippet(texts.get((kind, log_id), ""), query))
+        for kind, log_id, hit_project, created_at in matches
+    ]
+
+
+async def get_usage_totals() -> dict[str, UsageTotals]:
+    if not settings.DATABASE_URL:
+        return usage_totals
+
+    from sqlalchemy import func, select
+    from claudebot.tools.db import ClaudeUsageLog, Session, init_db
+
+    await init_db()
+    query = select(
+        ClaudeUsageLog.project,
+        func.count(),
+        func.sum(ClaudeUsageLog.input_tokens),
+        func.sum(ClaudeUsageLog.output_tokens),
+        func.sum(ClaudeUsageLog.cost_usd),
+        func.sum(ClaudeUsageLog.num_turns),
+        func.sum(ClaudeUsageLog.duration_ms),
+    ).group_by(ClaudeUsageLog.project)
+    async with Session() as session:
+        rows = (await session.execute(query)).all()
+    return {
+        project or "": UsageTotals(*(value or 0 for value in values))
+        for project, *values in rows
+    }
+
+
+async def get_tier_latency() -> dict[tuple[str, str], TierLatency]:
+    """Returns the wall clock latency of Claude runs by (tier, model)."""
+    if not settings.DATABASE_URL:
+        return tier_latency
+
+    from sqlalchemy import func, select
+    from claudebot.tools.db import ClaudeUsageLog, Session, init_db
+
+    await init_db()
+    query = (
+        select(
+            ClaudeUsageLog.tier,
+            ClaudeUsageLog.model,
+            func.count(),
+            func.sum(ClaudeUsageLog.latency_ms),
+            func.max(ClaudeUsageLog.latency_ms),
+        )
+        .where(ClaudeUsageLog.latency_ms.is_not(None))
+        .group_by(ClaudeUsageLog.tier, ClaudeUsageLog.model)
+    )
+    async with Session() as session:
+        rows = (await session.execute(query)).all()
+    return {
+        (tier or "", model or ""): TierLatency(runs or 0, total or 0, longest or 0)
+        for tier, model, runs, total, longest in rows
+    }
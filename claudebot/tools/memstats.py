@@ -0,0 +1,120 @@
+import asyncio
+import glob
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+
+from claudebot.settings import settings
+
+TOP_SITES = 10
+# Allocations made by tracemalloc itself and the import machinery only add noise
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def rss_kb() -> int:
+    """The resident set size, from /proc where available, else the peak from getrusage."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux but in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if os.uname().sysname == "Darwin" else peak
+
+
+@dataclass
+class MemoryReport:
+    rss_kb: int
+    traced_kb: int
+    peak_traced_kb: int
+    top: list[tracemalloc.Statistic]
+    growth: list[tracemalloc.StatisticDiff]
+    previous_age: float | None
+
+
+class MemoryProfiler:
+    """Traces allocations with tracemalloc when `MEMORY_PROFILING` is on.
+
+    Every `MEMORY_SNAPSHOT_INTERVAL_MINUTES` a snapshot is dumped to
+    `MEMORY_SNAPSHOT_DIR`, keeping the latest `MEMORY_SNAPSHOT_KEEP`; load them
+    with `tracemalloc.Snapshot.load` to compare any two offline. `report` diffs
+    against the previous snapshot, periodic or not.
+    """
+
+    def __init__(self):
+        self.previous: tracemalloc.Snapshot | None = None
+        self.previous_at: float | None = None
+        # report() and the periodic snapshots both run in worker threads
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        if settings.MEMORY_PROFILING and not tracemalloc.is_tracing():
+            tracemalloc.start(settings.MEMORY_TRACEBACK_FRAMES)
+
+    def take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+    def report(self, top: int = TOP_SITES) -> MemoryReport:
+        traced, peak = tracemalloc.get_traced_memory() if self.enabled else (0, 0)
+        report = MemoryReport(rss_kb(), traced // 1024, peak // 1024, [], [], None)
+        if not self.enabled:
+            return report
+        snapshot = self.take_snapshot()
+        report.top = snapshot.statistics("lineno")[:top]
+        with self.lock:
+            previous, previous_at = self.previous, self.previous_at
+            self.previous, self.previous_at = snapshot, time.monotonic()
+        if previous:
+            report.growth = [
+                stat for stat in snapshot.compare_to(previous, "lineno")[:top] if stat.size_diff
+            ]
+            report.previous_age = time.monotonic() - (previous_at or 0)
+        return report
+
+    def snapshot_to_disk(self) -> str:
+        snapshot = self.take_snapshot()
+        with self.lock:
+            self.previous, self.previous_at = snapshot, time.monotonic()
+        return self.dump(snapshot)
+
+    def dump(self, snapshot: tracemalloc.Snapshot) -> str:
+        os.makedirs(settings.MEMORY_SNAPSHOT_DIR, exist_ok=True)
+        path = os.path.join(
+            settings.MEMORY_SNAPSHOT_DIR, f"memstats-{datetime.now():%Y%m%d-%H%M%S}.tracemalloc"
+        )
+        snapshot.dump(path)
+        dumps = sorted(glob.glob(os.path.join(settings.MEMORY_SNAPSHOT_DIR, "memstats-*.tracemalloc")))
+        for old in dumps[: max(0, len(dumps) - settings.MEMORY_SNAPSHOT_KEEP)]:
+            os.remove(old)
+        return path
+
+    async def run(self):
+        self.start()
+        if not self.enabled or settings.MEMORY_SNAPSHOT_INTERVAL_MINUTES <= 0:
+            return
+        while True:
+            await asyncio.sleep(settings.MEMORY_SNAPSHOT_INTERVAL_MINUTES * 60)
+            try:
+                path = await asyncio.to_thread(self.snapshot_to_disk)
+                print(f"Memory snapshot written to {path}, RSS {rss_kb() // 1024} MB")
+            except Exception as e:
+                print(f"Failed to write a memory snapshot: {e}")
+
+
+memory_profiler = MemoryProfiler()
@@ -0,0 +1,66 @@
+import asyncio
+import os
+from dataclasses import dataclass, field
+
+SAMPLE_INTERVAL = 1.0
+PROC_DIR = "/proc"
+
+
+@dataclass
+class ProcessUsage:
+    """Resources used by a process tree, sampled from /proc.
+
+    CPU time is a lower bound: children that start and exit between two
+    samples are not seen.
+    """
+
+    peak_rss_kb: int = 0
+    cpu_ms: int = 0
+    children: int = 0
+    cpu_ticks: dict[int, int] = field(default_factory=dict, repr=False)
+
+    def summary(self) -> str:
+        return (
+            f"CPU {self.cpu_ms / 1000:.1f}s · peak RSS {self.peak_rss_kb / 1024:.0f} MB · "
+            f"{self.children} subprocesses"
+        )
+
+
+def _read_stat(pid: str) -> list[str] | None:
+    try:
+        with open(f"{PROC_DIR}/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces and parentheses; the fields after it do not
+    return stat.rpartition(")")[2].split()
+
+
+def sample_session(session_id: int, usage: ProcessUsage):
+    """Adds one sample of the processes in session `session_id` to `usage`.
+
+    Fields are those of proc(5), counted from `state`: session is the 4th,
+    utime and stime the 12th and 13th, rss the 22nd.
+    """
+    rss_kb = 0
+    page_kb = os.sysconf("SC_PAGE_SIZE") // 1024
+    for pid in os.listdir(PROC_DIR):
+        if not pid.isdigit():
+            continue
+        fields = _read_stat(pid)
+        if not fields or len(fields) < 22 or int(fields[3]) != session_id:
+            continue
+        usage.cpu_ticks[int(pid)] = int(fields[11]) + int(fields[12])
+        rss_kb += int(fields[21]) * page_kb
+    usage.peak_rss_kb = max(usage.peak_rss_kb, rss_kb)
+    usage.cpu_ms = sum(usage.cpu_ticks.values()) * 1000 // os.sysconf("SC_CLK_TCK")
+    usage.children = len(usage.cpu_ticks.keys() - {session_id})
+
+
+async def watch_session(session_id: int, usage: ProcessUsage, interval: float = SAMPLE_INTERVAL):
+    """Samples the session until cancelled; does nothing where /proc is missing."""
+    if not os.path.isdir(PROC_DIR):
+        return
+    while True:
+        await asyncio.to_thread(sample_session, session_id, usage)
+        await asyncio.sleep(interval)
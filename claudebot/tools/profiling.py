@@ -0,0 +1,65 @@
+import asyncio
+import builtins
+import sys
+import time
+
+REPORT_TOP_PACKAGES = 15
+
+
+class StartupProfiler:
+    """Measures the self import time of each top-level package and the time to first poll."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.import_times: dict[str, float] = {}
+        self.imports_done_at: float | None = None
+        self._children: list[float] = []
+        self._original_import = builtins.__import__
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        module = name
+        if level and globals:
+            module = f"{globals.get('__package__') or ''}.{name}"
+        if module in sys.modules and not fromlist:
+            return self._original_import(name, globals, locals, fromlist, level)
+        self._children.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self._children.pop()
+            if self._children:
+                self._children[-1] += elapsed
+            package = module.strip(".").split(".")[0]
+            self.import_times[package] = self.import_times.get(package, 0) + elapsed - children
+
+    def __enter__(self):
+        builtins.__import__ = self._import
+        return self
+
+    def __exit__(self, *exc):
+        builtins.__import__ = self._original_import
+        self.imports_done_at = time.perf_counter()
+
+    def report_imports(self):
+        total = (self.imports_done_at or time.perf_counter()) - self.started_at
+        print(f"Startup profile: imports took {total * 1000:.0f} ms")
+        ranked = sorted(self.import_times.items(), key=lambda item: item[1], reverse=True)
+        for package, seconds in ranked[:REPORT_TOP_PACKAGES]:
+            print(f"  {package:<24} {seconds * 1000:8.1f} ms")
+
+    async def report_first_poll(self, application):
+        while not (application.updater and application.updater.running):
+            await asyncio.sleep(0.005)
+        elapsed = time.perf_counter() - self.started_at
+        print(f"Startup profile: first poll after {elapsed * 1000:.0f} ms")
+
+
+profiler: StartupProfiler | None = None
+
+
+def start_profiling() -> StartupProfiler:
+    global profiler
+    profiler = StartupProfiler()
+    return profiler
@@ -0,0 +1,179 @@
+import html
+import re
+
+MAX_MESSAGE_LENGTH = 4096
+
+HTML_ESCAPE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+ATTRIBUTE_ESCAPE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"})
+
+FENCE = re.compile(r"^\s*(`{3,}|~{3,})\s*([\w+#.-]*)")
+HEADING = re.compile(r"^ {0,3}#{1,6}\s+(.*?)\s*#*\s*$")
+BULLET = re.compile(r"^(\s*)[-*+]\s+(.*)$")
+RULE = re.compile(r"^ {0,3}([-*_])(\s*\1){2,}\s*$")
+QUOTE = re.compile(r"^ {0,3}>\s?(.*)$")
+TABLE_ROW = re.compile(r"^\s*\|.*\|\s*$")
+CODE_SPAN = re.compile(r"(`+)(.+?)\1")
+LINK = re.compile(r"\[([^\]\n]+)\]\(([^)\s]+)\)")
+BOLD = re.compile(r"\*\*(?=\S)(.+?)(?<=\S)\*\*|(?<!\w)__(?=\S)(.+?)(?<=\S)__(?!\w)")
+STRIKE = re.compile(r"~~(?=\S)(.+?)(?<=\S)~~")
+ITALIC = re.compile(r"(?<![\w*])\*(?=[^\s*])(.+?)(?<=[^\s*])\*(?!\w)|(?<!\w)_(?=\S)(.+?)(?<=\S)_(?!\w)")
+TAG = re.compile(r"<[^>]+>")
+
+
+def _link(match: re.Match) -> str:
+    return f'<a href="{html.unescape(match.group(2)).translate(ATTRIBUTE_ESCAPE)}">{match.group(1)}</a>'
+
+
+def render_inline(text: str) -> str:
+    parts = []
+    position = 0
+    for match in CODE_SPAN.finditer(text):
+        parts.append(_render_emphasis(text[position : match.start()]))
+        parts.append(f"<code>{match.group(2).strip().translate(HTML_ESCAPE)}</code>")
+        position = match.end()
+    parts.append(_render_emphasis(text[position:]))
+    return "".join(parts)
+
+
+def _render_emphasis(text: str) -> str:
+    if not text:
+        return ""
+    text = text.translate(HTML_ESCAPE)
+    text = LINK.sub(_link, text)
+    text = BOLD.sub(lambda m: f"<b>{m.group(1) or m.group(2)}</b>", text)
+    text = STRIKE.sub(r"<s>\1</s>", text)
+    return ITALIC.sub(lambda m: f"<i>{m.group(1) or m.group(2)}</i>", text)
+
+
+def _render_line(line: str) -> str:
+    if RULE.match(line):
+        return "——————"
+    heading = HEADING.match(line)
+    if heading:
+        return f"<b>{render_inline(heading.group(1))}</b>"
+    bullet = BULLET.match(line)
+    if bullet:
+        return f"{bullet.group(1)}• {render_inline(bullet.group(2))}"
+    return render_inline(line)
+
+
+def _pre(lines: list[str], language: str) -> str:
+    code = "\n".join(lines).translate(HTML_ESCAPE)
+    if language:
+        return f'<pre><code class="language-{language}">{code}</code></pre>'
+    return f"<pre>{code}</pre>"
+
+
+def parse_blocks(text: str) -> list[tuple[str, list[str], str]]:
+    """Splits markdown into (kind, lines, language) blocks: code, table, quote or text."""
+    blocks: list[tuple[str, list[str], str]] = []
+    lines = text.split("\n")
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        fence = FENCE.match(line)
+        if fence:
+            marker = fence.group(1)
+            code = []
+            index += 1
+            while index < len(lines) and not lines[index].strip().startswith(marker):
+                code.append(lines[index])
+                index += 1
+            blocks.append(("code", code, fence.group(2)))
+            index += 1
+            continue
+        if not line.strip():
+            index += 1
+            continue
+        kind = "table" if TABLE_ROW.match(line) else "quote" if QUOTE.match(line) else "text"
+        block = []
+        while index < len(lines) and lines[index].strip() and not FENCE.match(lines[index]):
+            current = lines[index]
+            current_kind = (
+                "table" if TABLE_ROW.match(current) else "quote" if QUOTE.match(current) else "text"
+            )
+            if current_kind != kind:
+                break
+            block.append(QUOTE.match(current).group(1) if kind == "quote" else current)  # type: ignore
+            index += 1
+        blocks.append((kind, block, ""))
+    return blocks
+
+
+def _split_long_line(line: str, limit: int) -> list[str]:
+    pieces = []
+    current = ""
+    for char in line:
+        escaped = char.translate(HTML_ESCAPE)
+        if len(current) + len(escaped) > limit:
+            pieces.append(current)
+            current = ""
+        current += escaped
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def render_block(kind: str, lines: list[str], language: str, limit: int) -> list[str]:
+    """Renders a block into HTML pieces that fit `limit`, never leaving a tag open."""
+    overhead = len(_pre([], language)) + 1
+    if kind in ("code", "table"):
+        pieces: list[str] = []
+        current: list[str] = []
+        size = overhead
+        for line in lines:
+            escaped_length = len(line.translate(HTML_ESCAPE)) + 1
+            if escaped_length + overhead > limit:
+                if current:
+                    pieces.append(_pre(current, language))
+                pieces.extend(
+                    f"<pre>{piece}</pre>"
+                    for piece in _split_long_line(line, limit - overhead)
+                )
+                current, size = [], overhead
+                continue
+            if current and size + escaped_length > limit:
+                pieces.append(_pre(current, language))
+                current, size = [], overhead
+            current.append(line)
+            size += escaped_length
+        if current or not pieces:
+            pieces.append(_pre(current, language))
+        return pieces
+
+    rendered = []
+    for line in lines:
+        html_line = _render_line(line)
+        if len(html_line) + 25 > limit:
+            rendered.extend(_split_long_line(line, limit - 25))
+        else:
+            rendered.append(html_line)
+    if kind == "quote":
+        return [f"<blockquote>{line}</blockquote>" for line in _pack(rendered, limit - 25, "\n")]
+    return _pack(rendered, limit, "\n")
+
+
+def _pack(pieces: list[str], limit: int, separator: str) -> list[str]:
+    chunks: list[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(separator) + len(piece) > limit:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}{separator}{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def render_markdown(text: str, limit: int = MAX_MESSAGE_LENGTH) -> list[str]:
+    """Converts CommonMark to Telegram HTML, split into messages on block boundaries."""
+    pieces = []
+    for kind, lines, language in parse_blocks(text):
+        pieces.extend(render_block(kind, lines, language, limit))
+    return _pack(pieces, limit, "\n\n")
+
+
+def to_plain_text(chunk: str) -> str:
+    return html.unescape(TAG.sub("", chunk))
@@ -0,0 +1,86 @@
+import os
+import tomllib
+from dataclasses import dataclass
+
+from claudebot.settings import settings
+
+PROJECT_CONFIG_FILE = ".claudebot.toml"
+# "!" starts a fresh session, "?" uses plan mode, "~" asks for the fast tier
+PROMPT_PREFIXES = "!?~"
+
+
+def split_prefixes(message: str) -> tuple[str, str]:
+    """Splits the leading prompt prefixes, in any order, from the prompt."""
+    prefixes = ""
+    while message[:1] and message[0] in PROMPT_PREFIXES and message[0] not in prefixes:
+        prefixes += message[0]
+        message = message[1:]
+    return prefixes, message
+
+
+@dataclass
+class Route:
+    tier: str
+    model: str
+    effort: str
+
+
+_configs: dict[str, tuple[float, dict]] = {}
+
+
+def load_project_config(project_path: str) -> dict:
+    """Reads `.claudebot.toml` from the project root, cached by mtime."""
+    path = os.path.join(project_path, PROJECT_CONFIG_FILE)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return {}
+    cached = _configs.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path, "rb") as f:
+            config = tomllib.load(f)
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        print(f"Ignoring invalid {path}: {e}")
+        config = {}
+    _configs[path] = (mtime, config)
+    return config
+
+
+def route_prompt(project_path: str, message: str, plan_mode: bool = False, fast: bool = False) -> Route:
+    """Picks the tier of a prompt, then its model and effort.
+
+    `~` selects the fast tier, plan mode the plan tier, and prompts shorter
+    than `short_prompt_chars` the fast tier. Every setting can be overridden in
+    the project's `.claudebot.toml`:
+
+        [routing]
+        plan_tier = "fast"
+        short_prompt_chars = 200
+
+        [tiers.default]
+        model = "opus"
+
+        [tiers.fast]
+        model = "haiku"
+        effort = "low"
+    """
+    config = load_project_config(project_path)
+    routing = config.get("routing", {})
+    short_prompt_chars = routing.get("short_prompt_chars", settings.SHORT_PROMPT_CHARS)
+    if fast:
+        tier = "fast"
+    elif plan_mode:
+        tier = routing.get("plan_tier", settings.PLAN_TIER)
+    elif short_prompt_chars and len(message) < short_prompt_chars:
+        tier = "fast"
+    else:
+        tier = "default"
+    defaults = {
+        "default": (settings.MODEL, settings.EFFORT),
+        "fast": (settings.FAST_MODEL, settings.FAST_EFFORT),
+    }
+    model, effort = defaults.get(tier, defaults["default"])
+    overrides = config.get("tiers", {}).get(tier, {})
+    return Route(tier, overrides.get("model", model), overrides.get("effort", effort))
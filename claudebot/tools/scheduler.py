@@ -1,8 +1,23 @@
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+import threading
+from typing import TYPE_CHECKING
 
-jobstores = {
-    'default': SQLAlchemyJobStore(url='sqlite:///jobs.sqlite')
-}
+if TYPE_CHECKING:
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-scheduler = AsyncIOScheduler(jobstores=jobstores)
\ No newline at end of file
+_scheduler: "AsyncIOScheduler | None" = None
+_lock = threading.Lock()
+
+
+def get_scheduler() -> "AsyncIOScheduler":
+    # APScheduler pulls in SQLAlchemy for its job store, so it is only built on first use
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            from apscheduler.schedulers.asyncio import AsyncIOScheduler
+            from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+
+            jobstores = {
+                'default': SQLAlchemyJobStore(url='sqlite:///jobs.sqlite')
+            }
+            _scheduler = AsyncIOScheduler(jobstores=jobstores)
+    return _scheduler
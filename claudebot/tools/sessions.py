@@ -0,0 +1,131 @@
+import json
+import os
+import re
+import shutil
+import time
+from dataclasses import dataclass
+
+from claudebot.settings import settings
+from claudebot.tools.context import ctx
+
+CLAUDE_PROJECTS_DIR = os.path.expanduser("~/.claude/projects")
+PREVIEW_MAX_LINES = 200
+PREVIEW_LENGTH = 60
+
+
+@dataclass
+class SessionInfo:
+    session_id: str
+    project: str
+    path: str
+    size: int
+    last_used: float
+    preview: str = ""
+
+
+def transcripts_dir(project: str) -> str:
+    project_path = os.path.join(settings.projects_dir, project)
+    return os.path.join(CLAUDE_PROJECTS_DIR, re.sub(r"[^a-zA-Z0-9]", "-", project_path))
+
+
+def _read_preview(path: str) -> str:
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            for _, line in zip(range(PREVIEW_MAX_LINES), f):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("type") != "user" or entry.get("isSidechain"):
+                    continue
+                content = (entry.get("message") or {}).get("content")
+                if isinstance(content, list):
+                    content = " ".join(
+                        c.get("text", "") for c in content if c.get("type") == "text"
+                    )
+                if isinstance(content, str) and content.strip():
+                    return " ".join(content.split())[:PREVIEW_LENGTH]
+    except OSError:
+        pass
+    return ""
+
+
+class SessionRegistry:
+    """Index of the Claude CLI session transcripts of each project."""
+
+    def __init__(self):
+        self.index: dict[str, dict[str, SessionInfo]] = {}
+
+    def refresh(self, project: str) -> dict[str, SessionInfo]:
+        previous = self.index.get(project, {})
+        sessions: dict[str, SessionInfo] = {}
+        directory = transcripts_dir(project)
+        if os.path.isdir(directory):
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".jsonl") or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    session_id = entry.name[: -len(".jsonl")]
+                    known = previous.get(session_id)
+                    sessions[session_id] = SessionInfo(
+                        session_id=session_id,
+                        project=project,
+                        path=entry.path,
+                        size=stat.st_size,
+                        last_used=stat.st_mtime,
+                        preview=known.preview if known else _read_preview(entry.path),
+                    )
+        self.index[project] = sessions
+        return sessions
+
+    def sessions(self, project: str) -> list[SessionInfo]:
+        return sorted(
+            self.refresh(project).values(), key=lambda s: s.last_used, reverse=True
+        )
+
+    def latest(self, project: str) -> SessionInfo | None:
+        sessions = self.sessions(project)
+        return sessions[0] if sessions else None
+
+    def get(self, project: str, session_id: str) -> SessionInfo | None:
+        return self.refresh(project).get(session_id)
+
+    def delete(self, session: SessionInfo):
+        try:
+            os.remove(session.path)
+        except FileNotFoundError:
+            pass
+        # Newer CLI versions keep subagent and tool output next to the transcript
+        shutil.rmtree(session.path[: -len(".jsonl")], ignore_errors=True)
+        self.index.get(session.project, {}).pop(session.session_id, None)
+
+    def prune(self, project: str, keep: set[str] | None = None) -> int:
+        keep = keep or set()
+        max_age = settings.SESSION_RETENTION_DAYS * 86400
+        removed = 0
+        for position, session in enumerate(self.sessions(project)):
+            if session.session_id in keep:
+                continue
+            too_old = max_age and time.time() - session.last_used > max_age
+            too_many = (
+                settings.SESSION_MAX_PER_PROJECT
+                and position >= settings.SESSION_MAX_PER_PROJECT
+            )
+            if too_old or too_many:
+                self.delete(session)
+                removed += 1
+        return removed
+
+
+session_registry = SessionRegistry()
+
+
+def prune_sessions():
+    keep = set(ctx.selected_sessions.values())
+    removed = 0
+    for project in os.listdir(settings.projects_dir):
+        if os.path.isdir(os.path.join(settings.projects_dir, project)):
+            removed += session_registry.prune(project, keep)
+    if removed:
+        print(f"Pruned {removed} old Claude session transcripts")
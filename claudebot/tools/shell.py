@@ -1,7 +1,15 @@
 import asyncio
+import re
+import time
+from typing import Awaitable, Callable
 
 
 async def run_command(cmd: str, cwd: str = ".") -> tuple[int, str]:
+    ret_code, stdout, stderr = await run_command_split(cmd, cwd=cwd)
+    return ret_code, stdout + stderr
+
+
+async def run_command_split(cmd: str, cwd: str = ".") -> tuple[int, str, str]:
     process = await asyncio.create_subprocess_shell(
         cmd,
         cwd=cwd,
@@ -9,7 +17,45 @@ async def run_command(cmd: str, cwd: str = ".") -> tuple[int, str]:
         stderr=asyncio.subprocess.PIPE,
     )
     stdout, stderr = await process.communicate()
-    output = stdout.decode("utf-8", errors="ignore") + stderr.decode(
-        "utf-8", errors="ignore"
+    return (
+        process.returncode or 0,
+        stdout.decode("utf-8", errors="ignore"),
+        stderr.decode("utf-8", errors="ignore"),
+    )
+
+
+def collapse_progress(output: str) -> str:
+    """Keeps only the final state of lines rewritten with carriage returns."""
+    return "\n".join(line.rsplit("\r", 1)[-1] for line in output.rstrip("\r").split("\n"))
+
+
+async def stream_command(
+    cmd: str,
+    cwd: str = ".",
+    on_progress: Callable[[str], Awaitable] | None = None,
+    interval: float = 2.0,
+) -> tuple[int, str]:
+    """Runs a command, reporting its latest output line every `interval` seconds."""
+    process = await asyncio.create_subprocess_shell(
+        cmd,
+        cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+    )
+    output = bytearray()
+    last_report = time.monotonic()
+    while process.stdout:
+        chunk = await process.stdout.read(4096)
+        if not chunk:
+            break
+        output += chunk
+        if on_progress and time.monotonic() - last_report >= interval:
+            last_report = time.monotonic()
+            tail = output[-512:].decode("utf-8", errors="ignore")
+            latest = re.split(r"[\r\n]+", tail.strip())[-1]
+            if latest:
+                await on_progress(latest)
+    await process.wait()
+    return process.returncode or 0, collapse_progress(
+        output.decode("utf-8", errors="ignore")
     )
-    return process.returncode or 0, output
@@ -0,0 +1,89 @@
+import os
+import shlex
+
+from claudebot.tools.routing import load_project_config
+from claudebot.tools.shell import run_command, run_command_split
+
+SPARSE_USAGE = (
+    "Usage: /sparse to show the checkout, /sparse set <dir>..., /sparse add <dir>..., "
+    "/sparse profile <name> or /sparse off"
+)
+
+
+async def sparse_directories(project_path: str) -> list[str] | None:
+    """Returns the directories of a cone mode sparse checkout.
+
+    None means every file is checked out, or the patterns are not in cone mode
+    and cannot be read as directories.
+    """
+    for key in ("core.sparseCheckout", "core.sparseCheckoutCone"):
+        ret_code, output = await run_command(f"git config --bool {key}", cwd=project_path)
+        if ret_code != 0 or output.strip() != "true":
+            return None
+    ret_code, output, _ = await run_command_split("git sparse-checkout list", cwd=project_path)
+    if ret_code != 0:
+        return None
+    return [line for line in output.splitlines() if line]
+
+
+def in_cone(path: str, directories: list[str]) -> bool:
+    """Tells whether a cone mode checkout holds `path`.
+
+    Cone mode checks out the root files, everything under the cone directories,
+    and the files directly in the parents of those directories.
+    """
+    if "/" not in path:
+        return True
+    parent = path.rsplit("/", 1)[0] + "/"
+    return any(
+        path.startswith(directory + "/") or (directory + "/").startswith(parent)
+        for directory in directories
+    )
+
+
+def sparse_profiles(project_path: str) -> dict[str, list[str]]:
+    """Reads the named cone profiles from the project's `.claudebot.toml`:
+
+        [sparse.profiles]
+        api = ["services/api", "libs/common"]
+    """
+    profiles = load_project_config(project_path).get("sparse", {}).get("profiles", {})
+    return {name: list(directories) for name, directories in profiles.items()}
+
+
+def resolve_directories(project_path: str, entries: list[str]) -> list[str]:
+    """Expands `@profile` entries and checks the directories, raising ValueError on bad input."""
+    directories = []
+    for entry in entries:
+        if entry.startswith("@"):
+            profiles = sparse_profiles(project_path)
+            if entry[1:] not in profiles:
+                raise ValueError(
+                    f"Unknown sparse profile: {entry[1:]}. "
+                    f"Available: {', '.join(profiles) or 'none, see [sparse.profiles] in .claudebot.toml'}"
+                )
+            directories += profiles[entry[1:]]
+            continue
+        directory = entry.strip("/")
+        if not directory or os.path.isabs(entry) or ".." in directory.split("/"):
+            raise ValueError(f"Invalid directory: {entry}")
+        directories.append(directory)
+    return directories
+
+
+async def set_sparse(project_path: str, directories: list[str], add: bool = False) -> tuple[int, str]:
+    """Narrows the checkout to `directories` in cone mode, with a sparse index.
+
+    With `add`, the directories are added to the current cone instead.
+    """
+    quoted = " ".join(shlex.quote(directory) for directory in directories)
+    if add:
+        return await run_command(f"git sparse-checkout add {quoted}", cwd=project_path)
+    return await run_command(
+        f"git sparse-checkout set --cone --sparse-index {quoted}", cwd=project_path
+    )
+
+
+async def disable_sparse(project_path: str) -> tuple[int, str]:
+    """Checks out every file again."""
+    return await run_command("git sparse-checkout disable", cwd=project_path)
@@ -0,0 +1,98 @@
+import json
+import os
+from collections import deque
+from dataclasses import dataclass
+
+READ_WINDOW = 1024 * 1024
+MAX_EVENTS = 50
+TOOL_INPUT_KEYS = ("command", "file_path", "path", "pattern", "url", "description")
+
+
+@dataclass
+class TranscriptEvent:
+    kind: str
+    text: str
+
+
+def _tool_summary(name: str, tool_input: dict) -> str:
+    for key in TOOL_INPUT_KEYS:
+        value = tool_input.get(key)
+        if isinstance(value, str) and value:
+            return f"{name}: {value}"
+    return name
+
+
+def parse_events(entry: dict) -> list[TranscriptEvent]:
+    if entry.get("type") != "assistant":
+        return []
+    content = (entry.get("message") or {}).get("content")
+    if not isinstance(content, list):
+        return []
+    events = []
+    for item in content:
+        if item.get("type") == "text" and item.get("text", "").strip():
+            events.append(TranscriptEvent("text", item["text"].strip()))
+        elif item.get("type") == "tool_use":
+            events.append(
+                TranscriptEvent(
+                    "tool", _tool_summary(item.get("name", "tool"), item.get("input") or {})
+                )
+            )
+    return events
+
+
+class TranscriptTailer:
+    """Follows a session transcript, reading only the bytes appended since the last call.
+
+    A single read is bounded by `READ_WINDOW`: when more than that was appended,
+    the older part is skipped, so peeking a huge transcript stays cheap.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset: int | None = None
+        self.partial = b""
+        self.events: deque[TranscriptEvent] = deque(maxlen=MAX_EVENTS)
+
+    def read_new(self) -> list[TranscriptEvent]:
+        size = os.path.getsize(self.path)
+        if self.offset is None or size < self.offset:
+            self.offset = 0
+            self.partial = b""
+        skip_partial_line = False
+        if size - self.offset > READ_WINDOW:
+            self.offset = size - READ_WINDOW
+            self.partial = b""
+            skip_partial_line = self.offset > 0
+        if size == self.offset:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        self.offset += len(data)
+        lines = (self.partial + data).split(b"\n")
+        self.partial = lines.pop()
+        if skip_partial_line and lines:
+            lines = lines[1:]
+        new_events = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            new_events.extend(parse_events(entry))
+        self.events.extend(new_events)
+        return new_events
+
+
+tailers: dict[str, TranscriptTailer] = {}
+
+
+def get_tailer(path: str) -> TranscriptTailer:
+    for known in [p for p in tailers if p != path and not os.path.exists(p)]:
+        tailers.pop(known)
+    if path not in tailers:
+        tailers[path] = TranscriptTailer(path)
+    return tailers[path]
@@ -0,0 +1,48 @@
+import asyncio
+from typing import Awaitable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+def update_key(update: object) -> int | None:
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return None
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Processes the updates of a chat one at a time, in order, and different chats concurrently.
+
+    Handlers that start long work (Claude runs) detach it with
+    `application.create_task`, so the chat's next commands are not held back.
+    """
+
+    def __init__(self, max_concurrent_updates: int = 256):
+        super().__init__(max_concurrent_updates)
+        self.locks: dict[int | None, asyncio.Lock] = {}
+        self.pending: dict[int | None, int] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        key = update_key(update)
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        self.pending[key] = self.pending.get(key, 0) + 1
+        try:
+            # asyncio.Lock wakes its waiters in FIFO order, which keeps the chat's updates in order
+            async with lock:
+                await coroutine
+        finally:
+            self.pending[key] -= 1
+            if not self.pending[key]:
+                del self.pending[key]
+                del self.locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass, field
+
+from claudebot.settings import settings
+
+LAG_SAMPLES = 1000
+STACK_DEPTH = 6
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class Blocker:
+    """A stack seen while the event loop was blocked, with the time attributed to it."""
+
+    location: str
+    samples: int = 0
+    blocked: float = 0
+    stack: list[str] = field(default_factory=list)
+
+
+def _blocker_location(frames: traceback.StackSummary) -> str:
+    """Names a blocker by its innermost frame, plus the innermost bot frame that led to it."""
+    innermost = frames[-1]
+    location = f"{os.path.basename(innermost.filename)}:{innermost.lineno} in {innermost.name}"
+    own = next(
+        (frame for frame in reversed(frames) if frame.filename.startswith(PACKAGE_DIR)),
+        None,
+    )
+    if own and own is not innermost:
+        location = f"{os.path.basename(own.filename)}:{own.lineno} in {own.name} -> {location}"
+    return location
+
+
+class LoopWatchdog:
+    """Measures event loop lag and samples the loop thread's stack while it is blocked.
+
+    A task on the loop ticks every `interval` seconds and records how late each
+    tick was. A helper thread watches the last tick: when the loop has not
+    ticked for `LOOP_LAG_THRESHOLD_MS`, it samples the loop thread's stack
+    every half threshold until the loop ticks again. Each sample attributes
+    that half threshold to the stack, like a sampling profiler.
+    """
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.lags: deque[float] = deque(maxlen=LAG_SAMPLES)
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.blockers: dict[str, Blocker] = {}
+        self.heartbeat = time.monotonic()
+        self.started_at: float | None = None
+        self._loop_thread_id: int | None = None
+        self._stop = threading.Event()
+
+    @property
+    def threshold(self) -> float:
+        return settings.LOOP_LAG_THRESHOLD_MS / 1000
+
+    async def run(self):
+        if self.threshold <= 0 or self.started_at is not None:
+            return
+        self.started_at = time.monotonic()
+        self._loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        threading.Thread(target=self._sample, name="loop-watchdog", daemon=True).start()
+        try:
+            while True:
+                start = time.monotonic()
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                lag = max(0.0, now - start - self.interval)
+                self.heartbeat = now
+                self.lags.append(lag)
+                self.max_lag = max(self.max_lag, lag)
+                if lag >= self.threshold:
+                    self.stalls += 1
+        finally:
+            self._stop.set()
+
+    def _sample(self):
+        period = self.threshold / 2
+        while not self._stop.wait(period):
+            if time.monotonic() - self.heartbeat < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)  # type: ignore
+            if frame is None:
+                continue
+            frames = traceback.extract_stack(frame)
+            del frame
+            location = _blocker_location(frames)
+            blocker = self.blockers.get(location)
+            if not blocker:
+                blocker = self.blockers[location] = Blocker(location)
+            blocker.samples += 1
+            blocker.blocked += period
+            blocker.stack = [
+                f"{os.path.basename(f.filename)}:{f.lineno} {f.name}: {f.line or ''}".strip()
+                for f in frames[-STACK_DEPTH:]
+            ]
+
+    def percentile(self, percent: float) -> float:
+        if not self.lags:
+            return 0
+        ordered = sorted(self.lags)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+    def worst_blockers(self, count: int = 5) -> list[Blocker]:
+        return sorted(self.blockers.values(), key=lambda b: b.blocked, reverse=True)[:count]
+
+
+loop_watchdog = LoopWatchdog()
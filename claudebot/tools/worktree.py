@@ -0,0 +1,144 @@
+import os
+import shlex
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+from claudebot.settings import settings
+from claudebot.tools.context import ctx
+from claudebot.tools.shell import run_command
+
+WORKTREE_SEPARATOR = "@"
+
+
+@dataclass
+class Worktree:
+    project: str
+    name: str
+    path: str
+    branch: str
+
+
+def is_worktree(project: str) -> bool:
+    return WORKTREE_SEPARATOR in project
+
+
+def base_project(project: str) -> str:
+    return project.split(WORKTREE_SEPARATOR, 1)[0]
+
+
+class WorktreePool:
+    """Pool of git worktrees living next to the main checkout as `<project>@wt<n>`.
+
+    Worktree directories are regular entries of `settings.projects_dir`, so they
+    can be selected and pushed with the usual commands once a run is done.
+    """
+
+    def __init__(self):
+        self.busy: set[str] = set()
+        self.last_used: dict[str, float] = {}
+
+    def _names(self, project: str) -> list[str]:
+        prefix = f"{project}{WORKTREE_SEPARATOR}wt"
+        return sorted(
+            d
+            for d in os.listdir(settings.projects_dir)
+            if d.startswith(prefix)
+            and d[len(prefix) :].isdigit()
+            and os.path.isdir(os.path.join(settings.projects_dir, d))
+        )
+
+    def _is_idle(self, name: str) -> bool:
+        return (
+            name not in self.busy
+            and name not in ctx.claude_sessions
+            and name != ctx.current_project
+        )
+
+    def _last_used(self, name: str) -> float:
+        if name in self.last_used:
+            return self.last_used[name]
+        return os.path.getmtime(os.path.join(settings.projects_dir, name))
+
+    @staticmethod
+    def _branch(name: str) -> str:
+        suffix = name.split(WORKTREE_SEPARATOR, 1)[1]
+        return f"claudebot/{suffix}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+
+    @staticmethod
+    async def _is_clean(path: str) -> bool:
+        ret_code, output = await run_command("git status --porcelain", cwd=path)
+        return ret_code == 0 and not output.strip()
+
+    async def acquire(self, project: str) -> Worktree | None:
+        project_path = os.path.join(settings.projects_dir, project)
+        await self.gc(project)
+        ret_code, output = await run_command("git rev-parse HEAD", cwd=project_path)
+        if ret_code != 0:
+            raise ValueError(f"Cannot create a worktree for {project}:\n{output}")
+        head = output.strip()
+
+        names = self._names(project)
+        for name in names:
+            if not self._is_idle(name):
+                continue
+            self.busy.add(name)
+            path = os.path.join(settings.projects_dir, name)
+            branch = self._branch(name)
+            if await self._is_clean(path):
+                ret_code, _ = await run_command(
+                    f"git checkout -B {branch} {head}", cwd=path
+                )
+                if ret_code == 0:
+                    return Worktree(project, name, path, branch)
+            self.busy.discard(name)
+
+        # Re-listed after the awaits above; busy names also cover worktrees still being created
+        prefix = f"{project}{WORKTREE_SEPARATOR}wt"
+        taken = set(self._names(project)) | {name for name in self.busy if name.startswith(prefix)}
+        if len(taken) >= settings.WORKTREE_POOL_SIZE:
+            return None
+        index = 1
+        while f"{prefix}{index}" in taken:
+            index += 1
+        name = f"{project}{WORKTREE_SEPARATOR}wt{index}"
+        self.busy.add(name)
+        path = os.path.join(settings.projects_dir, name)
+        branch = self._branch(name)
+        ret_code, output = await run_command(
+            f"git worktree add -b {branch} {shlex.quote(path)} {head}",
+            cwd=project_path,
+        )
+        if ret_code != 0:
+            self.busy.discard(name)
+            raise ValueError(f"Failed to create worktree {name}:\n{output}")
+        return Worktree(project, name, path, branch)
+
+    def release(self, worktree: Worktree):
+        self.busy.discard(worktree.name)
+        self.last_used[worktree.name] = time.time()
+
+    async def gc(self, project: str):
+        project_path = os.path.join(settings.projects_dir, project)
+        max_age = settings.WORKTREE_TTL_HOURS * 3600
+        for name in self._names(project):
+            if not self._is_idle(name) or time.time() - self._last_used(name) < max_age:
+                continue
+            path = os.path.join(settings.projects_dir, name)
+            if not await self._is_clean(path):
+                continue
+            _, branch = await run_command("git branch --show-current", cwd=path)
+            ret_code, output = await run_command(
+                f"git worktree remove {shlex.quote(path)}", cwd=project_path
+            )
+            if ret_code != 0:
+                print(f"Failed to remove worktree {name}:\n{output}")
+                continue
+            self.last_used.pop(name, None)
+            if branch.strip():
+                # Only drops branches already merged, unpushed work is kept
+                await run_command(f"git branch -d {branch.strip()}", cwd=project_path)
+        await run_command("git worktree prune", cwd=project_path)
+
+
+worktree_pool = WorktreePool()
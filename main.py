@@ -1,5 +1,13 @@
-from claudebot.app import run
+import sys
 
 if __name__ == "__main__":
     print("Starting ClaudeBot...")
-    run()
\ No newline at end of file
+    if "--profile-startup" in sys.argv:
+        from claudebot.tools.profiling import start_profiling
+
+        with start_profiling() as profiler:
+            from claudebot.app import run
+        profiler.report_imports()
+    else:
+        from claudebot.app import run
+    run()